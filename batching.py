@@ -0,0 +1,80 @@
+"""Event-loop helpers shared by the async facades.
+
+MicroBatcher collects items submitted close together and hands them to a
+coroutine as one batch: it backs Gemini request batching (gemini_parser)
+and group commit (db_async). LazySemaphore is a module-level semaphore that
+is only created once something awaits it, so it binds to the bot's running
+event loop rather than whichever one existed at import time.
+"""
+import asyncio
+
+
+class LazySemaphore:
+    """An asyncio.Semaphore created on first use."""
+
+    def __init__(self, value):
+        self._value = value
+        self._semaphore = None
+
+    def get(self):
+        """Returns the semaphore, creating it on the running event loop the first time."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._value)
+        return self._semaphore
+
+
+class MicroBatcher:
+    """
+    Groups items submitted within a short window into batches.
+
+    A batch is handed to `handler` once `window_ms` has passed since its first
+    item arrived or once it holds `max_size` items, whichever comes first.
+    The handler is a coroutine function taking a list of (item, future) pairs
+    and is responsible for resolving every future.
+    """
+
+    def __init__(self, handler, window_ms, max_size):
+        self._handler = handler
+        self._window = window_ms / 1000
+        self._max_size = max_size
+        self._pending = []
+        self._timer = None
+        # Running handler tasks, referenced so they aren't garbage collected
+        self._tasks = set()
+
+    @property
+    def pending(self):
+        """Number of items waiting for the next batch."""
+        return len(self._pending)
+
+    def submit(self, item):
+        """
+        Queues an item for the next batch.
+
+        Returns: future the handler resolves with the item's result.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self._max_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._window, self.flush)
+        return future
+
+    def flush(self):
+        """Hands everything waiting to the handler now."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._handler(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def drain(self):
+        """Hands over what is waiting and waits for every running batch to finish."""
+        self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,121 @@
+"""Micro-benchmark: chart renderers against an earlier chart_generator.
+
+The baseline engine is loaded straight from git, by default the last pyplot
+based version, and compared with the current matplotlib renderer
+(chart_generator) and the Pillow one (chart_pillow) on the same sample data
+in the same process.
+
+    python benchmark_charts.py [--baseline REV] [--repeat N] [--threads N]
+"""
+import time
+import argparse
+import subprocess
+import statistics
+import types
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import matplotlib
+matplotlib.use('Agg')
+
+import chart_generator
+import chart_pillow
+
+SUMMARY = {
+    'expenses_by_category': {'Food': 412.5, 'Transport': 96.0, 'Housing': 1200.0, 'Entertainment': 64.2,
+                             'Shopping': 230.9, 'Utilities': 88.0},
+    'total_resisted': 145.0,
+}
+TIME_SERIES = {
+    'dates': [(date(2025, 6, 1) + timedelta(days=i)).isoformat() for i in range(31)],
+    'expenses': [float((i * 37) % 90) for i in range(31)],
+    'resisted': [float((i * 11) % 25) for i in range(31)],
+}
+# Three years by day, as a long custom range would be without adaptive bucketing
+LONG_TIME_SERIES = {
+    'dates': [(date(2023, 1, 1) + timedelta(days=i)).isoformat() for i in range(1096)],
+    'expenses': [float((i * 37) % 90) for i in range(1096)],
+    'resisted': [float((i * 11) % 25) for i in range(1096)],
+}
+
+CASES = {
+    'pie': lambda engine: engine.generate_pie_chart(SUMMARY, 'This Month'),
+    'dual_pie': lambda engine: engine.generate_dual_pie_chart(SUMMARY, 'This Month'),
+    'bar': lambda engine: engine.generate_bar_chart(TIME_SERIES, 'This Month', 'day'),
+    'bar_long': lambda engine: engine.generate_bar_chart(LONG_TIME_SERIES, 'Three Years', 'day'),
+}
+
+
+def find_pyplot_revision():
+    """Returns the most recent commit whose chart_generator.py imports pyplot."""
+    revisions = subprocess.run(
+        ['git', 'log', '--format=%h', '--', 'chart_generator.py'], check=True, capture_output=True, text=True
+    ).stdout.split()
+    for revision in revisions:
+        source = subprocess.run(
+            ['git', 'show', f'{revision}:chart_generator.py'], capture_output=True, text=True
+        ).stdout
+        if 'import matplotlib.pyplot' in source:
+            return revision
+    raise SystemExit("No revision of chart_generator.py uses pyplot; pass --baseline")
+
+
+def load_revision(revision):
+    """Imports chart_generator.py as it was at a git revision."""
+    source = subprocess.run(
+        ['git', 'show', f'{revision}:chart_generator.py'], check=True, capture_output=True, text=True
+    ).stdout
+    module = types.ModuleType(f'chart_generator_{revision}')
+    exec(compile(source, f'{revision}:chart_generator.py', 'exec'), module.__dict__)
+    return module
+
+
+def time_case(engine, case, repeat):
+    """Returns per-render timings in milliseconds, after one warm-up render."""
+    CASES[case](engine)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        CASES[case](engine)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def time_threaded(engine, case, repeat, threads):
+    """Returns total wall time in milliseconds for repeat renders spread over threads."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for buffer in pool.map(lambda _: CASES[case](engine), range(repeat)):
+            buffer.getvalue()
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--baseline', help='git revision to compare against (default: last pyplot based one)')
+    parser.add_argument('--repeat', type=int, default=20, help='renders per chart and engine')
+    parser.add_argument('--threads', type=int, default=4, help='threads for the concurrency check (new engine only)')
+    args = parser.parse_args()
+
+    baseline_revision = args.baseline or find_pyplot_revision()
+    engines = {'baseline': load_revision(baseline_revision), 'current': chart_generator, 'pillow': chart_pillow}
+    print(f"{'chart':<10}{'engine':<10}{'median ms':>12}{'p90 ms':>10}{'bytes':>10}{'speedup':>10}")
+    for case in CASES:
+        baseline = None
+        for name, engine in engines.items():
+            timings = sorted(time_case(engine, case, args.repeat))
+            median = statistics.median(timings)
+            baseline = baseline or median
+            size = len(CASES[case](engine).getvalue())
+            print(f"{case:<10}{name:<10}{median:>12.1f}{timings[int(len(timings) * 0.9) - 1]:>10.1f}"
+                  f"{size:>10}{baseline / median:>9.2f}x")
+
+    # pyplot's global state isn't thread-safe, so the baseline isn't run concurrently
+    for case in CASES:
+        for name in ('current', 'pillow'):
+            wall = time_threaded(engines[name], case, args.repeat, args.threads)
+            print(f"{case} ({name}): {args.repeat} renders on {args.threads} threads in {wall:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
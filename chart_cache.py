@@ -0,0 +1,149 @@
+"""Cache of rendered charts and the Telegram file_ids they were uploaded as.
+
+Charts are keyed on a hash of the chart kind and everything passed to the
+renderer (data, title, interval), so identical requests, whether from one
+user tapping a button twice or several users with the same numbers, render
+once. After the first upload only Telegram's file_id is kept, and repeat
+sends skip both rendering and upload.
+
+PNG bytes are held in an LRU bounded by CHART_CACHE_MAX_BYTES. Entries are
+dropped when a user records a transaction inside the date range they cover.
+"""
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date
+
+from constants import CHART_CACHE_MAX_BYTES, CHART_CACHE_MAX_ENTRIES
+from chart_service import render_chart
+from db import parse_date_range
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    png: bytes = None
+    file_id: str = None
+    # (user_id, start_date, end_date) ranges the chart was requested for
+    scopes: set = field(default_factory=set)
+
+
+@dataclass
+class CachedChart:
+    """A chart ready to send: a Telegram file_id if it was uploaded before, else PNG bytes."""
+    key: str
+    photo: object
+
+    def remember_upload(self, message):
+        """Records the file_id Telegram assigned to the sent photo so it can be resent."""
+        if message is not None and message.photo:
+            _set_file_id(self.key, message.photo[-1].file_id)
+
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+_cached_bytes = 0
+
+
+def _to_json(value):
+    """Serializes what json can't: NumPy arrays as lists (str() would elide long ones), the rest as str."""
+    return value.tolist() if hasattr(value, 'tolist') else str(value)
+
+
+def make_key(kind, args):
+    """Hashes a chart kind and its renderer arguments into a cache key."""
+    payload = json.dumps([kind, args], sort_keys=True, default=_to_json)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _evict():
+    """Drops least recently used entries until the cache is within budget. Call with _lock held."""
+    global _cached_bytes
+    while _entries and (_cached_bytes > CHART_CACHE_MAX_BYTES or len(_entries) > CHART_CACHE_MAX_ENTRIES):
+        _, entry = _entries.popitem(last=False)
+        if entry.png is not None:
+            _cached_bytes -= len(entry.png)
+
+
+def _set_file_id(key, file_id):
+    """Stores the file_id for an entry and frees its PNG bytes."""
+    global _cached_bytes
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return
+        entry.file_id = file_id
+        if entry.png is not None:
+            _cached_bytes -= len(entry.png)
+            entry.png = None
+
+
+async def get_chart(kind, *args, user_id=None, time_range_str=None):
+    """
+    Returns a chart from the cache, rendering it on a miss.
+
+    Args:
+        kind, *args: Passed to chart_service.render_chart
+        user_id, time_range_str: Whose data and which range the chart shows,
+            so new transactions in that range invalidate it
+
+    Returns:
+        CachedChart, or None when there is no data to chart.
+    Raises:
+        ChartRenderError: see chart_service.render_chart.
+    """
+    global _cached_bytes
+    key = make_key(kind, args)
+    scope = None
+    if user_id is not None and time_range_str is not None:
+        start_date, end_date = parse_date_range(time_range_str)
+        scope = (user_id, start_date, end_date)
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+            if scope is not None:
+                entry.scopes.add(scope)
+            return CachedChart(key, entry.file_id or entry.png)
+
+    png = await render_chart(kind, *args)
+    if png is None:
+        return None
+
+    with _lock:
+        if key not in _entries:
+            _entries[key] = _Entry(png=png)
+            _cached_bytes += len(png)
+        entry = _entries[key]
+        if scope is not None:
+            entry.scopes.add(scope)
+        _evict()
+    return CachedChart(key, png)
+
+
+def invalidate(user_id, dates):
+    """
+    Drops charts of a user's data whose date range contains any of the given dates.
+
+    Args:
+        user_id: Owner of the new transactions
+        dates: Dates (date or YYYY-MM-DD) of the new transactions
+    """
+    global _cached_bytes
+    dates = [date.fromisoformat(d) if isinstance(d, str) else d for d in dates]
+    with _lock:
+        stale = [
+            key for key, entry in _entries.items()
+            if any(owner == user_id and start <= d <= end for owner, start, end in entry.scopes for d in dates)
+        ]
+        for key in stale:
+            entry = _entries.pop(key)
+            if entry.png is not None:
+                _cached_bytes -= len(entry.png)
+    if stale:
+        logger.debug(f"Invalidated {len(stale)} cached charts for user {user_id}")
@@ -0,0 +1,100 @@
+"""Vectorized preparation of time-series data for the bar chart renderers.
+
+Both renderers go through prepare_bar_data(), which bounds how much a chart
+draws however long its range is: at most CHART_MAX_BARS bar pairs (adjacent
+periods are summed together past that), CHART_MAX_TICK_LABELS x-axis labels
+and CHART_MAX_BAR_ANNOTATIONS value labels. Labels are built with NumPy
+array operations instead of parsing and formatting each date in Python.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+from constants import CHART_MAX_BARS, CHART_MAX_TICK_LABELS, CHART_MAX_BAR_ANNOTATIONS
+
+MONTH_NAMES = np.array(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])
+
+
+@dataclass
+class BarChartData:
+    """Bars to draw, aligned by index, and which of them get a label."""
+    labels: np.ndarray
+    expenses: np.ndarray
+    resisted: np.ndarray
+    # Every tick_step-th bar gets an x-axis label
+    tick_step: int
+    annotate_expenses: np.ndarray
+    annotate_resisted: np.ndarray
+
+
+def format_period_labels(dates, interval):
+    """
+    Formats the first days of periods as axis labels for the given interval.
+
+    Args:
+        dates: Sequence of YYYY-MM-DD strings or a datetime64 array
+        interval: 'day', 'week', or 'month'
+
+    Returns:
+        Array of labels like 'Jun 01', 'Week of Jun 02' or 'Jun 2025'
+    """
+    days = np.asarray(dates, dtype='datetime64[D]')
+    months = days.astype('datetime64[M]')
+    labels = np.char.add(MONTH_NAMES[months.astype(np.int64) % 12], ' ')
+    if interval == 'month':
+        return np.char.add(labels, (months.astype('datetime64[Y]').astype(np.int64) + 1970).astype(str))
+    labels = np.char.add(labels, np.char.zfill(((days - months).astype(np.int64) + 1).astype(str), 2))
+    if interval == 'week':
+        return np.char.add('Week of ', labels)
+    return labels
+
+
+def _merge_periods(days, expenses, resisted, max_bars):
+    """Sums runs of adjacent periods so there are at most max_bars; each run keeps its first date."""
+    group = -(-len(days) // max_bars)
+    if group <= 1:
+        return days, expenses, resisted
+    padding = -len(days) % group
+
+    def merge(values):
+        return np.pad(values, (0, padding)).reshape(-1, group).sum(axis=1)
+
+    return days[::group], merge(expenses), merge(resisted)
+
+
+def _annotation_masks(expenses, resisted, limit):
+    """Marks the non-zero bars to label: all of them, or the `limit` tallest across both series."""
+    values = np.concatenate([expenses, resisted])
+    mask = values > 0
+    if np.count_nonzero(mask) > limit:
+        tallest = np.argpartition(values, -limit)[-limit:]
+        mask = np.zeros_like(mask)
+        mask[tallest] = True
+        mask &= values > 0
+    return mask[:len(expenses)], mask[len(expenses):]
+
+
+def prepare_bar_data(time_data, interval):
+    """
+    Converts get_transactions_time_series() output into bounded arrays for drawing.
+
+    Args:
+        time_data: Dictionary with dates, expenses, and resisted amounts
+        interval: Grouping interval ('day', 'week', or 'month')
+
+    Returns:
+        BarChartData
+    """
+    days = np.asarray(time_data['dates'], dtype='datetime64[D]')
+    expenses = np.asarray(time_data['expenses'], dtype=np.float64)
+    resisted = np.asarray(time_data['resisted'], dtype=np.float64)
+    days, expenses, resisted = _merge_periods(days, expenses, resisted, CHART_MAX_BARS)
+    annotate_expenses, annotate_resisted = _annotation_masks(expenses, resisted, CHART_MAX_BAR_ANNOTATIONS)
+    return BarChartData(
+        labels=format_period_labels(days, interval),
+        expenses=expenses,
+        resisted=resisted,
+        tick_step=max(1, -(-len(days) // CHART_MAX_TICK_LABELS)),
+        annotate_expenses=annotate_expenses,
+        annotate_resisted=annotate_resisted,
+    )
@@ -1,31 +1,53 @@
-import matplotlib.pyplot as plt
+"""Chart rendering on matplotlib's object-oriented Figure API.
+
+Every chart builds its own Figure with an Agg canvas, so nothing touches
+pyplot's global figure manager and the functions are safe to call from
+concurrent threads or worker processes. Axes sit at fixed positions (see the
+*_AXES constants) instead of being fitted with tight_layout() and
+bbox_inches='tight', which each cost an extra layout pass per render.
+"""
 import io
-from datetime import datetime, timedelta
+
 import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
+from chart_data import prepare_bar_data
 
-def generate_pie_chart(summary_data, title):
-    """Generate a pie chart from transaction summary data."""
-    expenses = summary_data.get('expenses_by_category', {})
+DPI = 100
+# Gap in points between a pie and its title, clearing the outer wedge labels
+PIE_TITLE_PAD = 28
 
-    # If there's no expense data, don't generate a chart
-    if not expenses:
-        return None
+# Figure sizes in inches and axes rectangles as (left, bottom, width, height)
+# fractions of the figure, chosen to leave room for titles, labels and legends.
+# The dual pies keep 15% of the width free at each outer edge and between
+# them, so outer wedge labels like 'Resisted (Not Spent)' aren't clipped
+PIE_FIGSIZE = (10, 6)
+PIE_AXES = (0.15, 0.06, 0.7, 0.74)
+DUAL_PIE_FIGSIZE = (14, 7)
+DUAL_PIE_LEFT_AXES = (0.15, 0.05, 0.28, 0.7)
+DUAL_PIE_RIGHT_AXES = (0.57, 0.05, 0.28, 0.7)
+BAR_FIGSIZE = (12, 7)
+BAR_AXES = (0.08, 0.17, 0.9, 0.76)
 
-    # Create figure and axis
-    fig, ax = plt.subplots(figsize=(10, 6))
 
-    # Create the pie chart
-    labels = list(expenses.keys())
-    values = list(expenses.values())
+def _new_figure(figsize):
+    """Creates a Figure attached to its own Agg canvas."""
+    fig = Figure(figsize=figsize, dpi=DPI)
+    FigureCanvasAgg(fig)
+    return fig
 
-    # Add resisted spending as a separate category if it exists
-    total_resisted = summary_data.get('total_resisted', 0)
-    if total_resisted > 0:
-        labels.append('Resisted')
-        values.append(total_resisted)
 
-    # Plot with some nice styling
+def _to_png(fig):
+    """Renders a figure to a PNG buffer."""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=DPI)
+    buffer.seek(0)
+    return buffer
+
+
+def _draw_pie(ax, labels, values, label_size, percent_size):
+    """Draws a styled pie chart on an axes."""
     wedges, texts, autotexts = ax.pie(
         values,
         labels=labels,
@@ -33,28 +55,38 @@ def generate_pie_chart(summary_data, title):
         startangle=90,
         shadow=True,
     )
-
-    # Style the text
     for text in texts:
-        text.set_fontsize(12)
+        text.set_fontsize(label_size)
     for autotext in autotexts:
-        autotext.set_fontsize(10)
+        autotext.set_fontsize(percent_size)
         autotext.set_color('white')
-
     # Equal aspect ratio ensures the pie chart is circular
     ax.axis('equal')
 
-    plt.title(f'Spending Breakdown - {title}', fontsize=14)
 
-    # Save to a buffer
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png', dpi=100, bbox_inches='tight')
-    buffer.seek(0)
+def generate_pie_chart(summary_data, title):
+    """Generate a pie chart from transaction summary data."""
+    expenses = summary_data.get('expenses_by_category', {})
+
+    # If there's no expense data, don't generate a chart
+    if not expenses:
+        return None
 
-    # Close the figure to free up memory
-    plt.close(fig)
+    labels = list(expenses.keys())
+    values = list(expenses.values())
 
-    return buffer
+    # Add resisted spending as a separate category if it exists
+    total_resisted = summary_data.get('total_resisted', 0)
+    if total_resisted > 0:
+        labels.append('Resisted')
+        values.append(total_resisted)
+
+    fig = _new_figure(PIE_FIGSIZE)
+    ax = fig.add_axes(PIE_AXES)
+    _draw_pie(ax, labels, values, label_size=12, percent_size=10)
+    ax.set_title(f'Spending Breakdown - {title}', fontsize=14, pad=PIE_TITLE_PAD)
+
+    return _to_png(fig)
 
 
 def generate_dual_pie_chart(summary_data, title):
@@ -66,76 +98,30 @@ def generate_dual_pie_chart(summary_data, title):
     if not expenses and resisted == 0:
         return None
 
-    # Create figure with two subplots
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 7))
+    fig = _new_figure(DUAL_PIE_FIGSIZE)
+    ax1 = fig.add_axes(DUAL_PIE_LEFT_AXES)
+    ax2 = fig.add_axes(DUAL_PIE_RIGHT_AXES)
 
     # First pie chart: Actual spending
     if expenses:
-        labels1 = list(expenses.keys())
-        values1 = list(expenses.values())
-
-        wedges1, texts1, autotexts1 = ax1.pie(
-            values1,
-            labels=labels1,
-            autopct='%1.1f%%',
-            startangle=90,
-            shadow=True,
-        )
-
-        # Style the text for first chart
-        for text in texts1:
-            text.set_fontsize(10)
-        for autotext in autotexts1:
-            autotext.set_fontsize(8)
-            autotext.set_color('white')
+        _draw_pie(ax1, list(expenses.keys()), list(expenses.values()), label_size=10, percent_size=8)
     else:
-        ax1.text(0.5, 0.5, "No expenses", ha='center', va='center', fontsize=14)
-
-    ax1.set_title('Actual Spending', fontsize=14)
-    ax1.axis('equal')
+        ax1.text(0.5, 0.5, "No expenses", ha='center', va='center', fontsize=14, transform=ax1.transAxes)
+        ax1.axis('off')
+    ax1.set_title('Actual Spending', fontsize=14, pad=PIE_TITLE_PAD)
 
     # Second pie chart: Hypothetical including resisted
-    if expenses or resisted > 0:
-        labels2 = list(expenses.keys())
-        values2 = list(expenses.values())
-
-        # Add resisted as a category
-        if resisted > 0:
-            labels2.append('Resisted (Not Spent)')
-            values2.append(resisted)
-
-        wedges2, texts2, autotexts2 = ax2.pie(
-            values2,
-            labels=labels2,
-            autopct='%1.1f%%',
-            startangle=90,
-            shadow=True,
-        )
-
-        # Style the text for second chart
-        for text in texts2:
-            text.set_fontsize(10)
-        for autotext in autotexts2:
-            autotext.set_fontsize(8)
-            autotext.set_color('white')
-    else:
-        ax2.text(0.5, 0.5, "No data", ha='center', va='center', fontsize=14)
+    labels2 = list(expenses.keys())
+    values2 = list(expenses.values())
+    if resisted > 0:
+        labels2.append('Resisted (Not Spent)')
+        values2.append(resisted)
+    _draw_pie(ax2, labels2, values2, label_size=10, percent_size=8)
+    ax2.set_title('Hypothetical (If Resisted Was Spent)', fontsize=14, pad=PIE_TITLE_PAD)
 
-    ax2.set_title('Hypothetical (If Resisted Was Spent)', fontsize=14)
-    ax2.axis('equal')
+    fig.suptitle(f'Spending Analysis - {title}', fontsize=16)
 
-    plt.suptitle(f'Spending Analysis - {title}', fontsize=16)
-    plt.tight_layout()
-
-    # Save to a buffer
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png', dpi=100, bbox_inches='tight')
-    buffer.seek(0)
-
-    # Close the figure to free up memory
-    plt.close(fig)
-
-    return buffer
+    return _to_png(fig)
 
 
 def generate_bar_chart(time_data, title, interval='day'):
@@ -144,61 +130,32 @@ def generate_bar_chart(time_data, title, interval='day'):
 
     Args:
         time_data: Dictionary with dates, expenses, and resisted amounts
+            (lists or arrays, e.g. TimeSeries.to_chart_data())
         title: Chart title
         interval: Grouping interval ('day', 'week', or 'month')
 
     Returns:
-        BytesIO buffer with the chart image
+        BytesIO buffer with the chart image, or None if every amount is zero
     """
-    if not time_data or not time_data.get('dates'):
+    if not time_data or len(time_data.get('dates', ())) == 0:
         return None
 
-    dates = time_data.get('dates', [])
-    expenses = time_data.get('expenses', [])
-    resisted = time_data.get('resisted', [])
-
-    # Ensure we have data to display
-    if len(dates) == 0:
+    data = prepare_bar_data(time_data, interval)
+    if not (data.expenses.any() or data.resisted.any()):
         return None
 
-    # Create figure and axis
-    fig, ax = plt.subplots(figsize=(12, 7))
+    fig = _new_figure(BAR_FIGSIZE)
+    ax = fig.add_axes(BAR_AXES)
 
-    # Set width of bars
+    # Set width and positions of bars on x-axis
     width = 0.35
+    x_pos = np.arange(len(data.labels))
 
-    # Set positions of bars on x-axis
-    x_pos = np.arange(len(dates))
-
-    # Create bars
-    expense_bars = ax.bar(x_pos - width / 2, expenses, width, label='Spent', color='#FF6B6B')
-    resisted_bars = ax.bar(x_pos + width / 2, resisted, width, label='Resisted', color='#4ECDC4')
-
-    # Format x-ticks with date labels
-    date_labels = []
-    for date_str in dates:
-        try:
-            if interval == 'day':
-                # Just show month and day
-                dt = datetime.strptime(date_str, '%Y-%m-%d')
-                date_labels.append(dt.strftime('%b %d'))
-            elif interval == 'week':
-                # Show as week starting date
-                dt = datetime.strptime(date_str, '%Y-%m-%d')
-                date_labels.append(f'Week of {dt.strftime("%b %d")}')
-            elif interval == 'month':
-                # Show month and year
-                if len(date_str) >= 7:  # Ensure we have YYYY-MM
-                    year_month = date_str[:7]  # Get YYYY-MM part
-                    dt = datetime.strptime(year_month, '%Y-%m')
-                    date_labels.append(dt.strftime('%b %Y'))
-                else:
-                    date_labels.append(date_str)
-        except ValueError:
-            # Fallback if parsing fails
-            date_labels.append(date_str)
-
-    plt.xticks(x_pos, date_labels, rotation=45)
+    ax.bar(x_pos - width / 2, data.expenses, width, label='Spent', color='#FF6B6B')
+    ax.bar(x_pos + width / 2, data.resisted, width, label='Resisted', color='#4ECDC4')
+
+    ax.set_xticks(x_pos[::data.tick_step])
+    ax.set_xticklabels(data.labels[::data.tick_step], rotation=45)
 
     # Add labels and legend
     ax.set_xlabel('Time Period')
@@ -206,23 +163,10 @@ def generate_bar_chart(time_data, title, interval='day'):
     ax.set_title(f'Spending Over Time - {title}', fontsize=14)
     ax.legend()
 
-    # Add values on top of bars
-    for i, v in enumerate(expenses):
-        if v > 0:
-            ax.text(i - width / 2, v + 0.5, f'${v:.1f}', ha='center', fontsize=8)
-
-    for i, v in enumerate(resisted):
-        if v > 0:
-            ax.text(i + width / 2, v + 0.5, f'${v:.1f}', ha='center', fontsize=8)
-
-    plt.tight_layout()
-
-    # Save to a buffer
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png', dpi=100, bbox_inches='tight')
-    buffer.seek(0)
-
-    # Close the figure to free up memory
-    plt.close(fig)
+    # Add values on top of the bars picked by prepare_bar_data
+    for offset, values, mask in ((-width / 2, data.expenses, data.annotate_expenses),
+                                 (width / 2, data.resisted, data.annotate_resisted)):
+        for i, v in zip(np.flatnonzero(mask), values[mask]):
+            ax.text(i + offset, v + 0.5, f'${v:.1f}', ha='center', fontsize=8)
 
-    return buffer
\ No newline at end of file
+    return _to_png(fig)
@@ -0,0 +1,230 @@
+"""Chart renderer drawing straight to a raster image with Pillow.
+
+A lighter alternative to chart_generator for the bot's simple charts: no
+layout engine, no artist tree, just shapes and text on an Image. It has the
+same functions and return values as chart_generator, so chart_service can
+use either (see CHART_RENDERER). Shapes are drawn at SUPERSAMPLE times the
+output size and box-filtered down once, which gives smooth edges without
+per-shape antialiasing. The charts use few colors, so the PNG is written
+with a 256-color palette, about a quarter the size of an RGB one.
+"""
+import io
+import math
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from chart_data import prepare_bar_data
+
+# Output sizes in pixels, matching chart_generator at 100 dpi
+PIE_SIZE = (1000, 600)
+DUAL_PIE_SIZE = (1400, 700)
+BAR_SIZE = (1200, 700)
+
+SUPERSAMPLE = 2
+
+BACKGROUND = (255, 255, 255)
+TEXT_COLOR = (0, 0, 0)
+AXIS_COLOR = (0, 0, 0)
+GRID_COLOR = (225, 225, 225)
+SPENT_COLOR = '#FF6B6B'
+RESISTED_COLOR = '#4ECDC4'
+# matplotlib's default color cycle, so both renderers color categories alike
+PALETTE = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+           '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+
+FONT_FILE = 'DejaVuSans.ttf'
+
+
+@lru_cache(maxsize=None)
+def _font(size):
+    """Returns a font of the given pixel size, cached per size."""
+    try:
+        return ImageFont.truetype(FONT_FILE, size)
+    except OSError:
+        return ImageFont.load_default(size)
+
+
+def _new_image(size):
+    """Creates a white canvas at the supersampled size and a drawing context for it."""
+    image = Image.new('RGB', (size[0] * SUPERSAMPLE, size[1] * SUPERSAMPLE), BACKGROUND)
+    return image, ImageDraw.Draw(image)
+
+
+def _to_png(image):
+    """Scales a supersampled image down to its output size and encodes it as a palette PNG."""
+    buffer = io.BytesIO()
+    image = image.reduce(SUPERSAMPLE) if SUPERSAMPLE > 1 else image
+    image.quantize(256, method=Image.Quantize.FASTOCTREE).save(buffer, format='PNG')
+    buffer.seek(0)
+    return buffer
+
+
+def _text(draw, xy, text, size, anchor='mm', fill=TEXT_COLOR):
+    """Draws text at supersampled coordinates with a size given in output pixels."""
+    draw.text(xy, text, font=_font(size * SUPERSAMPLE), fill=fill, anchor=anchor)
+
+
+def _draw_pie(draw, center, radius, labels, values, label_size, percent_size):
+    """
+    Draws a pie starting at 12 o'clock and going counter-clockwise, with
+    labels outside and percentages inside each wedge, like matplotlib's pie().
+    """
+    total = float(sum(values))
+    if total <= 0:
+        return
+    cx, cy = center
+    box = (cx - radius, cy - radius, cx + radius, cy + radius)
+    angle = 90.0
+    for i, (label, value) in enumerate(zip(labels, values)):
+        sweep = 360.0 * value / total
+        # Pillow measures angles clockwise from 3 o'clock
+        draw.pieslice(box, -(angle + sweep), -angle, fill=PALETTE[i % len(PALETTE)])
+        middle = math.radians(angle + sweep / 2)
+        dx, dy = math.cos(middle), -math.sin(middle)
+        _text(draw, (cx + 0.6 * radius * dx, cy + 0.6 * radius * dy), f'{100 * value / total:.1f}%',
+              percent_size, fill=(255, 255, 255))
+        label_anchor = ('l' if dx > 0.1 else 'r' if dx < -0.1 else 'm') + 'm'
+        _text(draw, (cx + 1.1 * radius * dx, cy + 1.1 * radius * dy), label, label_size, anchor=label_anchor)
+        angle += sweep
+
+
+def generate_pie_chart(summary_data, title):
+    """Generate a pie chart from transaction summary data."""
+    expenses = summary_data.get('expenses_by_category', {})
+    if not expenses:
+        return None
+
+    labels = list(expenses.keys())
+    values = list(expenses.values())
+    total_resisted = summary_data.get('total_resisted', 0)
+    if total_resisted > 0:
+        labels.append('Resisted')
+        values.append(total_resisted)
+
+    s = SUPERSAMPLE
+    image, draw = _new_image(PIE_SIZE)
+    _text(draw, (500 * s, 45 * s), f'Spending Breakdown - {title}', 14)
+    _draw_pie(draw, (500 * s, 330 * s), 220 * s, labels, values, label_size=12, percent_size=10)
+    return _to_png(image)
+
+
+def generate_dual_pie_chart(summary_data, title):
+    """Generate two pie charts: actual spending and hypothetical with resisted included."""
+    expenses = summary_data.get('expenses_by_category', {})
+    resisted = summary_data.get('total_resisted', 0)
+    if not expenses and resisted == 0:
+        return None
+
+    s = SUPERSAMPLE
+    image, draw = _new_image(DUAL_PIE_SIZE)
+    _text(draw, (700 * s, 30 * s), f'Spending Analysis - {title}', 16)
+
+    _text(draw, (350 * s, 110 * s), 'Actual Spending', 14)
+    if expenses:
+        _draw_pie(draw, (350 * s, 420 * s), 230 * s, list(expenses.keys()), list(expenses.values()),
+                  label_size=10, percent_size=8)
+    else:
+        _text(draw, (350 * s, 420 * s), 'No expenses', 14)
+
+    labels = list(expenses.keys())
+    values = list(expenses.values())
+    if resisted > 0:
+        labels.append('Resisted (Not Spent)')
+        values.append(resisted)
+    _text(draw, (1030 * s, 110 * s), 'Hypothetical (If Resisted Was Spent)', 14)
+    _draw_pie(draw, (1030 * s, 420 * s), 230 * s, labels, values, label_size=10, percent_size=8)
+
+    return _to_png(image)
+
+
+def _nice_step(max_value, target_ticks=6):
+    """Returns a 1/2/5 x 10^n tick step giving about target_ticks ticks up to max_value."""
+    raw = max_value / target_ticks
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for multiple in (1, 2, 5, 10):
+        if raw <= multiple * magnitude:
+            return multiple * magnitude
+    return 10 * magnitude
+
+
+def _rotated_label(text, size):
+    """Renders a tick label rotated by 45 degrees on a transparent tile."""
+    font = _font(size * SUPERSAMPLE)
+    left, top, right, bottom = font.getbbox(text)
+    tile = Image.new('L', (right - left + 2, bottom - top + 2), 0)
+    ImageDraw.Draw(tile).text((1 - left, 1 - top), text, font=font, fill=255)
+    return tile.rotate(45, expand=True, resample=Image.Resampling.BILINEAR)
+
+
+def generate_bar_chart(time_data, title, interval='day'):
+    """
+    Generate a bar chart showing expenses and resisted spending over time.
+
+    Args:
+        time_data: Dictionary with dates, expenses, and resisted amounts
+            (lists or arrays, e.g. TimeSeries.to_chart_data())
+        title: Chart title
+        interval: Grouping interval ('day', 'week', or 'month')
+
+    Returns:
+        BytesIO buffer with the chart image, or None if every amount is zero
+    """
+    if not time_data or len(time_data.get('dates', ())) == 0:
+        return None
+
+    data = prepare_bar_data(time_data, interval)
+    if not (data.expenses.any() or data.resisted.any()):
+        return None
+
+    s = SUPERSAMPLE
+    image, draw = _new_image(BAR_SIZE)
+    # Plot area in supersampled pixels
+    left, top, right, bottom = 96 * s, 70 * s, 1176 * s, 580 * s
+
+    max_value = max(data.expenses.max(), data.resisted.max(), 0) or 1
+    step = _nice_step(max_value * 1.05)
+    y_max = step * math.ceil(max_value * 1.05 / step)
+
+    def y_of(value):
+        return bottom - (bottom - top) * value / y_max
+
+    # Horizontal grid lines and y-axis labels
+    tick = 0
+    while tick <= y_max + step / 2:
+        y = y_of(tick)
+        draw.line((left, y, right, y), fill=GRID_COLOR, width=s)
+        _text(draw, (left - 8 * s, y), f'{tick:g}', 10, anchor='rm')
+        tick += step
+
+    slot = (right - left) / len(data.labels)
+    width = 0.35 * slot
+    centers = left + slot * (np.arange(len(data.labels)) + 0.5)
+    for offset, values, mask, color in ((-width / 2, data.expenses, data.annotate_expenses, SPENT_COLOR),
+                                        (width / 2, data.resisted, data.annotate_resisted, RESISTED_COLOR)):
+        for x, value, annotate in zip(centers + offset, values, mask):
+            if value > 0:
+                draw.rectangle((x - width / 2, y_of(value), x + width / 2, bottom), fill=color)
+            if annotate:
+                _text(draw, (x, y_of(value) - 3 * s), f'${value:.1f}', 8, anchor='mb')
+
+    for center, text in zip(centers[::data.tick_step], data.labels[::data.tick_step]):
+        label = _rotated_label(str(text), 10)
+        # Anchor the label's upper-right corner just below its tick
+        image.paste(TEXT_COLOR, (int(center - label.width), int(bottom + 6 * s)), label)
+
+    draw.rectangle((left, top, right, bottom), outline=AXIS_COLOR, width=s)
+
+    _text(draw, ((left + right) / 2, 35 * s), f'Spending Over Time - {title}', 14)
+    _text(draw, ((left + right) / 2, 685 * s), 'Time Period', 10)
+    ylabel = _rotated_label('Amount (USD)', 10).rotate(45, expand=True)
+    image.paste(TEXT_COLOR, (20 * s, int((top + bottom - ylabel.height) / 2)), ylabel)
+
+    # Legend in the upper-left corner of the plot area
+    for row, (name, color) in enumerate((('Spent', SPENT_COLOR), ('Resisted', RESISTED_COLOR))):
+        y = top + (16 + 22 * row) * s
+        draw.rectangle((left + 12 * s, y - 6 * s, left + 36 * s, y + 6 * s), fill=color)
+        _text(draw, (left + 44 * s, y), name, 10, anchor='lm')
+
+    return _to_png(image)
@@ -0,0 +1,158 @@
+"""Renders charts in a pool of worker processes.
+
+matplotlib rendering is CPU-bound and holds the GIL, so running it inside a
+handler blocks the event loop and uses a single core. Handlers instead await
+render_chart() with plain data (dicts, lists, strings) and get PNG bytes back
+from one of CHART_RENDER_PROCESSES workers.
+
+At most CHART_MAX_QUEUED_RENDERS renders are queued or running at once; past
+that, and for renders that take longer than CHART_RENDER_TIMEOUT_SECONDS,
+ChartRenderError is raised so the handler can tell the user to retry.
+
+Drawing is done by a renderer module picked with CHART_RENDERER (see
+RENDERERS). A renderer provides the functions in CHART_FUNCTIONS with
+chart_generator's signatures, each returning a BytesIO holding a PNG or None
+when there is no data. chart_generator (matplotlib) is the fallback when the
+configured renderer can't be imported or fails on a chart.
+"""
+import asyncio
+import logging
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from batching import LazySemaphore
+from constants import CHART_RENDER_PROCESSES, CHART_MAX_QUEUED_RENDERS, CHART_RENDER_TIMEOUT_SECONDS, CHART_RENDERER
+
+logger = logging.getLogger(__name__)
+
+# Chart kinds accepted by render_chart, mapped to renderer functions
+CHART_FUNCTIONS = {
+    'pie': 'generate_pie_chart',
+    'dual_pie': 'generate_dual_pie_chart',
+    'bar': 'generate_bar_chart',
+}
+
+# CHART_RENDERER values mapped to renderer modules
+RENDERERS = {
+    'matplotlib': 'chart_generator',
+    'pillow': 'chart_pillow',
+}
+FALLBACK_RENDERER = 'matplotlib'
+
+_pool = None
+
+# Bounds how many renders are queued or running on the pool
+_queue_slots = LazySemaphore(CHART_MAX_QUEUED_RENDERS)
+
+
+class ChartRenderError(Exception):
+    """Raised when a chart couldn't be rendered: queue full, timeout or worker crash."""
+
+
+def _load_renderer(name):
+    """Imports the renderer module for a CHART_RENDERER value."""
+    if name not in RENDERERS:
+        raise ValueError(f"Unknown chart renderer '{name}', expected one of {', '.join(RENDERERS)}")
+    return importlib.import_module(RENDERERS[name])
+
+
+def _init_worker():
+    """Imports the configured renderer once per worker process, before the first render."""
+    try:
+        _load_renderer(CHART_RENDERER)
+    except Exception as e:
+        logger.error(f"Chart renderer '{CHART_RENDERER}' unavailable, using {FALLBACK_RENDERER}: {e}")
+        _load_renderer(FALLBACK_RENDERER)
+
+
+def _render(kind, args):
+    """Runs in a worker: renders a chart and returns PNG bytes, or None if there's no data."""
+    if CHART_RENDERER != FALLBACK_RENDERER:
+        try:
+            buffer = getattr(_load_renderer(CHART_RENDERER), CHART_FUNCTIONS[kind])(*args)
+            return buffer.getvalue() if buffer is not None else None
+        except Exception as e:
+            logger.warning(f"Chart renderer '{CHART_RENDERER}' failed on a '{kind}' chart, "
+                           f"using {FALLBACK_RENDERER}: {e}")
+    buffer = getattr(_load_renderer(FALLBACK_RENDERER), CHART_FUNCTIONS[kind])(*args)
+    return buffer.getvalue() if buffer is not None else None
+
+
+def _warm_up():
+    """Runs in a worker: renders a throwaway chart so fonts and caches are loaded."""
+    _render('pie', ({'expenses_by_category': {'Food': 1.0}, 'total_resisted': 1.0}, 'Warm-up'))
+    return multiprocessing.current_process().pid
+
+
+def get_pool():
+    """Returns the shared process pool, starting it on first use."""
+    global _pool
+    if _pool is None:
+        # spawn rather than fork: the bot process already runs DB and HTTP threads
+        _pool = ProcessPoolExecutor(
+            max_workers=CHART_RENDER_PROCESSES,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+        )
+    return _pool
+
+
+def reset_pool():
+    """Discards the pool, e.g. after a worker crashed; the next render starts a new one."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def render_chart(kind, *args):
+    """
+    Renders a chart in a worker process.
+
+    Args:
+        kind: 'pie', 'dual_pie' or 'bar'
+        *args: Arguments for the matching renderer function
+
+    Returns:
+        PNG bytes, or None when there is no data to chart.
+    Raises:
+        ChartRenderError: the queue is full, the render timed out or a worker died.
+    """
+    slots = _queue_slots.get()
+    if slots.locked():
+        raise ChartRenderError(f"Chart queue is full ({CHART_MAX_QUEUED_RENDERS} renders pending)")
+
+    async with slots:
+        try:
+            future = asyncio.wrap_future(get_pool().submit(_render, kind, args))
+            return await asyncio.wait_for(future, CHART_RENDER_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            # The worker can't be interrupted; it finishes the render and moves on
+            logger.warning(f"Rendering a '{kind}' chart took longer than {CHART_RENDER_TIMEOUT_SECONDS}s")
+            raise ChartRenderError(f"Rendering a '{kind}' chart timed out")
+        except BrokenProcessPool as e:
+            logger.error(f"Chart worker died, restarting the pool: {e}")
+            reset_pool()
+            raise ChartRenderError("Chart worker crashed") from e
+
+
+async def warm_up():
+    """Starts every worker process and renders a throwaway chart in each."""
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    try:
+        pids = await asyncio.gather(*(loop.run_in_executor(pool, _warm_up) for _ in range(CHART_RENDER_PROCESSES)))
+    except Exception as e:
+        logger.error(f"Chart worker warm-up failed: {e}", exc_info=True)
+        return
+    logger.info(f"Chart rendering pool ready ({len(set(pids))} worker processes)")
+
+
+def shutdown():
+    """Stops the worker processes."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
@@ -1,7 +1,85 @@
+import os
+
 # Bot configuration
 BOT_TOKEN = ""
+# Telegram id of the user owning transactions recorded before they were
+# stored per user. Must be set (as an environment variable) to upgrade a
+# database that has any; the bot refuses to start without it.
+LEGACY_USER_ID = os.getenv("LEGACY_USER_ID")
 # Gemini API configuration
 GEMINI_API_KEY = ""
+# Maximum number of Gemini requests in flight at once
+GEMINI_MAX_CONCURRENCY = 32
+# Per-request timeout for Gemini calls, in milliseconds
+GEMINI_TIMEOUT_MS = 30000
+# Messages arriving within this window (or until the batch is full) are
+# parsed with a single Gemini call
+GEMINI_BATCH_WINDOW_MS = 30
+GEMINI_BATCH_MAX_SIZE = 16
+# Minimum confidence for the local parser to answer without calling Gemini
+FAST_PARSE_MIN_CONFIDENCE = 0.75
+
+# CSV file (date,currency,usd_per_unit) the exchange-rate table is loaded from
+FX_RATES_FILE = "fx_rates.csv"
+
+# Parse result cache: in-memory entries, SQLite rows and entry lifetime
+PARSE_CACHE_MEMORY_SIZE = 1024
+PARSE_CACHE_MAX_ROWS = 50000
+PARSE_CACHE_TTL_DAYS = 30
+
+# SQLite database file and connection tuning
+DB_PATH = "expenses.db"
+# Extra read-only connections kept open alongside the single writer
+DB_READER_POOL_SIZE = 4
+# Page cache per connection, in KiB
+DB_CACHE_SIZE_KB = 16384
+# Bytes of the database file to memory-map
+DB_MMAP_SIZE = 256 * 1024 * 1024
+DB_BUSY_TIMEOUT_MS = 5000
+# Prepared statements cached per connection
+DB_STATEMENT_CACHE_SIZE = 256
+# Threads running database calls for async handlers (see db_async.py), and
+# how many calls may be handed to them at once before callers wait
+DB_EXECUTOR_THREADS = DB_READER_POOL_SIZE + 1
+DB_MAX_QUEUED_CALLS = 64
+# Inserts arriving within this window (or until the group is full) are
+# committed together, so a burst of messages costs a single fsync
+DB_WRITE_BATCH_WINDOW_MS = 10
+DB_WRITE_BATCH_MAX_SIZE = 64
+# How often the running totals behind custom-range summaries catch up with
+# newly inserted (possibly back-dated) transactions
+CUMULATIVE_SYNC_INTERVAL_SECONDS = 5
+
+# Worker processes rendering charts (see chart_service.py), how many renders
+# may be queued or running before new ones are turned away, and how long a
+# single render may take
+CHART_RENDER_PROCESSES = os.cpu_count() or 1
+CHART_MAX_QUEUED_RENDERS = 4 * CHART_RENDER_PROCESSES
+CHART_RENDER_TIMEOUT_SECONDS = 20
+
+# Chart drawing backend: "matplotlib" (chart_generator.py) or "pillow"
+# (chart_pillow.py, faster and smaller PNGs; falls back to matplotlib on error)
+CHART_RENDERER = os.getenv("CHART_RENDERER", "matplotlib")
+
+# Bar chart limits (see chart_data.py): most bars on one chart, past which
+# longer ranges are grouped by week or month, then adjacent periods merged;
+# and most x-axis labels and value labels drawn
+CHART_MAX_BARS = 62
+CHART_MAX_TICK_LABELS = 31
+CHART_MAX_BAR_ANNOTATIONS = 24
+
+# Rendered charts kept for reuse (see chart_cache.py): PNG bytes held before
+# least recently used charts are dropped, and the number of charts remembered
+CHART_CACHE_MAX_BYTES = 32 * 1024 * 1024
+CHART_CACHE_MAX_ENTRIES = 2048
+
+# Transactions per /details page (see details_pages.py), and the longest
+# source text shown for one of them, so a page always fits in one message
+DETAILS_PAGE_SIZE = 20
+DETAILS_MAX_SOURCE_CHARS = 120
+
+# Longest a cold `import main` may take, checked by `python main.py --check-startup`
+STARTUP_BUDGET_SECONDS = 1.5
 
 # Categories for expenses/resisted spending
 EXPENSE_CATEGORIES = [
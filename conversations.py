@@ -7,8 +7,10 @@ from telegram.ext import (
 )
 
 from constants import TIME_RANGES
-from chart_generator import generate_dual_pie_chart, generate_bar_chart
-from db import get_transactions_summary, get_transactions_time_series, get_transactions_details
+from chart_service import ChartRenderError
+from chart_cache import get_chart
+from db_async import get_transactions_summary, get_time_series
+from details_pages import get_first_details_page
 
 # Define conversation states
 SELECT_TIMEFRAME = 0
@@ -16,6 +18,8 @@ SELECT_INTERVAL = 1
 
 logger = logging.getLogger(__name__)
 
+CHART_BUSY_MESSAGE = "⏳ Charts are busy right now, please try again in a moment."
+
 # --- Pie Chart Command Flow ---
 async def piechart_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start the pie chart command flow by asking for timeframe."""
@@ -63,15 +67,22 @@ async def piechart_timeframe_selected(update: Update, context: ContextTypes.DEFA
     # Process the built-in timeframe
     await query.edit_message_text("Generating your pie charts...")
 
-    summary = get_transactions_summary(selected_timeframe)
+    summary = await get_transactions_summary(update.effective_user.id, selected_timeframe)
     title = TIME_RANGES.get(selected_timeframe, selected_timeframe.replace("_", " ").title())
-    chart_buffer = generate_dual_pie_chart(summary, title)
+    try:
+        chart = await get_chart('dual_pie', summary, title,
+                                user_id=update.effective_user.id, time_range_str=selected_timeframe)
+    except ChartRenderError as e:
+        logger.warning(f"Chart for user {update.effective_user.id} failed: {e}")
+        await query.edit_message_text(CHART_BUSY_MESSAGE)
+        return ConversationHandler.END
 
-    if chart_buffer:
-        await update.effective_chat.send_photo(
-            photo=chart_buffer,
+    if chart:
+        message = await update.effective_chat.send_photo(
+            photo=chart.photo,
             caption=f"📊 Pie Charts ({title}) - Compare your actual spending with what might have been if you hadn't resisted those purchases!"
         )
+        chart.remember_upload(message)
         await query.delete_message()
     else:
         await query.edit_message_text(f"No data available for the selected period ({title}).")
@@ -130,15 +141,22 @@ async def barchart_timeframe_selected(update: Update, context: ContextTypes.DEFA
         # For "today," we don't need interval options - go straight to chart
         await query.edit_message_text("Generating your bar chart...")
 
-        time_data = get_transactions_time_series(selected_timeframe, "day")
+        series = await get_time_series(update.effective_user.id, selected_timeframe, "day")
         title = TIME_RANGES.get(selected_timeframe, selected_timeframe.replace("_", " ").title())
-        chart_buffer = generate_bar_chart(time_data, title, "day")
-
-        if chart_buffer:
-            await update.effective_chat.send_photo(
-                photo=chart_buffer,
+        try:
+            chart = await get_chart('bar', series.to_chart_data(), title, series.interval,
+                                    user_id=update.effective_user.id, time_range_str=selected_timeframe)
+        except ChartRenderError as e:
+            logger.warning(f"Chart for user {update.effective_user.id} failed: {e}")
+            await query.edit_message_text(CHART_BUSY_MESSAGE)
+            return ConversationHandler.END
+
+        if chart:
+            message = await update.effective_chat.send_photo(
+                photo=chart.photo,
                 caption=f"📊 Spending Today"
             )
+            chart.remember_upload(message)
             await query.delete_message()
         else:
             await query.edit_message_text(f"No data available for today.")
@@ -159,10 +177,9 @@ async def barchart_timeframe_selected(update: Update, context: ContextTypes.DEFA
         ]
 
     elif selected_timeframe == "3months":
-        # For longer ranges, all options make sense
+        # For longer ranges, week and month (~90 daily bars are over CHART_MAX_BARS)
         keyboard = [
             [
-                InlineKeyboardButton("By Day", callback_data="interval_day"),
                 InlineKeyboardButton("By Week", callback_data="interval_week"),
                 InlineKeyboardButton("By Month", callback_data="interval_month")
             ]
@@ -180,15 +197,22 @@ async def barchart_timeframe_selected(update: Update, context: ContextTypes.DEFA
         # Fallback - use daily grouping
         await query.edit_message_text("Generating your bar chart...")
 
-        time_data = get_transactions_time_series(selected_timeframe, "day")
+        series = await get_time_series(update.effective_user.id, selected_timeframe, "day")
         title = TIME_RANGES.get(selected_timeframe, selected_timeframe.replace("_", " ").title())
-        chart_buffer = generate_bar_chart(time_data, title, "day")
-
-        if chart_buffer:
-            await update.effective_chat.send_photo(
-                photo=chart_buffer,
-                caption=f"📊 Spending Over Time ({title}, daily view)"
+        try:
+            chart = await get_chart('bar', series.to_chart_data(), title, series.interval,
+                                    user_id=update.effective_user.id, time_range_str=selected_timeframe)
+        except ChartRenderError as e:
+            logger.warning(f"Chart for user {update.effective_user.id} failed: {e}")
+            await query.edit_message_text(CHART_BUSY_MESSAGE)
+            return ConversationHandler.END
+
+        if chart:
+            message = await update.effective_chat.send_photo(
+                photo=chart.photo,
+                caption=f"📊 Spending Over Time ({title}, grouped by {series.interval})"
             )
+            chart.remember_upload(message)
             await query.delete_message()
         else:
             await query.edit_message_text(f"No data available for the selected period ({title}).")
@@ -206,15 +230,22 @@ async def barchart_interval_selected(update: Update, context: ContextTypes.DEFAU
 
     await query.edit_message_text("Generating your bar chart...")
 
-    time_data = get_transactions_time_series(selected_timeframe, selected_interval)
+    series = await get_time_series(update.effective_user.id, selected_timeframe, selected_interval)
     title = TIME_RANGES.get(selected_timeframe, selected_timeframe.replace("_", " ").title())
-    chart_buffer = generate_bar_chart(time_data, title, selected_interval)
+    try:
+        chart = await get_chart('bar', series.to_chart_data(), title, series.interval,
+                                user_id=update.effective_user.id, time_range_str=selected_timeframe)
+    except ChartRenderError as e:
+        logger.warning(f"Chart for user {update.effective_user.id} failed: {e}")
+        await query.edit_message_text(CHART_BUSY_MESSAGE)
+        return ConversationHandler.END
 
-    if chart_buffer:
-        await update.effective_chat.send_photo(
-            photo=chart_buffer,
-            caption=f"📊 Spending Over Time ({title}, grouped by {selected_interval})"
+    if chart:
+        message = await update.effective_chat.send_photo(
+            photo=chart.photo,
+            caption=f"📊 Spending Over Time ({title}, grouped by {series.interval})"
         )
+        chart.remember_upload(message)
         await query.delete_message()
     else:
         await query.edit_message_text(f"No data available for the selected period ({title}).")
@@ -240,14 +271,21 @@ async def custom_range_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if chart_type == "pie":
         await update.message.reply_text("Generating your pie charts...")
 
-        summary = get_transactions_summary(custom_range)
-        chart_buffer = generate_dual_pie_chart(summary, "Custom Range")
-
-        if chart_buffer:
-            await update.message.reply_photo(
-                photo=chart_buffer,
+        summary = await get_transactions_summary(update.effective_user.id, custom_range)
+        try:
+            chart = await get_chart('dual_pie', summary, "Custom Range",
+                                    user_id=update.effective_user.id, time_range_str=custom_range)
+        except ChartRenderError as e:
+            logger.warning(f"Chart for user {update.effective_user.id} failed: {e}")
+            await update.message.reply_text(CHART_BUSY_MESSAGE)
+            return ConversationHandler.END
+
+        if chart:
+            message = await update.message.reply_photo(
+                photo=chart.photo,
                 caption=f"📊 Pie Charts ({custom_range}) - Compare your actual spending with what might have been!"
             )
+            chart.remember_upload(message)
         else:
             await update.message.reply_text(f"No data available for {custom_range}.")
 
@@ -323,7 +361,7 @@ async def summary_timeframe_selected(update: Update, context: ContextTypes.DEFAU
     # Process the built-in timeframe
     await query.edit_message_text("Generating your summary...")
 
-    summary = get_transactions_summary(selected_timeframe)
+    summary = await get_transactions_summary(update.effective_user.id, selected_timeframe)
     title = TIME_RANGES.get(selected_timeframe, selected_timeframe.replace("_", " ").title())
 
     response = [f"🧾 *Summary ({title})*\n"]
@@ -386,61 +424,8 @@ async def details_timeframe_selected(update: Update, context: ContextTypes.DEFAU
     # Process the built-in timeframe
     await query.edit_message_text("Fetching your transaction details...")
 
-    details = get_transactions_details(selected_timeframe)
-    title = TIME_RANGES.get(selected_timeframe, selected_timeframe.replace("_", " ").title())
-
-    response = [f"🧾 *Detailed View ({title})*\n"]
-
-    if details['expenses_by_category']:
-        for category, items in sorted(details['expenses_by_category'].items()):
-            response.append(f"*{category}*")
-            for item in items:
-                response.append(f"  - ${item['amount_usd']:,.2f} — _{item['source_text']}_")
-    else:
-        response.append("_No expenses recorded for this period._")
-
-    if details['resisted']:
-        response.append("\n*Resisted*")
-        for item in details['resisted']:
-            response.append(f"  - ${item['amount_usd']:,.2f} — _{item['source_text']}_")
-
-    message_text = "\n".join(response)
-
-    # Check if message exceeds Telegram's 4096 character limit
-    if len(message_text) > 4000:
-        # Split into multiple messages
-        await query.edit_message_text(
-            f"🧾 *Detailed View ({title})*\n\n"
-            f"_Your transaction list is very long. Sending it in multiple messages..._",
-            parse_mode='Markdown'
-        )
-
-        # Send chunks of the message
-        chunks = [response[0]]
-        current_chunk = []
-        current_length = 0
-
-        for line in response[1:]:
-            if current_length + len(line) + 1 > 3800:  # Leave some margin
-                # Send current chunk
-                await update.effective_chat.send_message(
-                    "\n".join(current_chunk),
-                    parse_mode='Markdown'
-                )
-                current_chunk = []
-                current_length = 0
-
-            current_chunk.append(line)
-            current_length += len(line) + 1  # +1 for newline
-
-        # Send any remaining chunk
-        if current_chunk:
-            await update.effective_chat.send_message(
-                "\n".join(current_chunk),
-                parse_mode='Markdown'
-            )
-    else:
-        await query.edit_message_text(message_text, parse_mode='Markdown')
+    text, reply_markup = await get_first_details_page(update.effective_user.id, selected_timeframe)
+    await query.edit_message_text(text, parse_mode='Markdown', reply_markup=reply_markup)
 
     return ConversationHandler.END
 
@@ -464,7 +449,7 @@ async def command_custom_range_input(update: Update, context: ContextTypes.DEFAU
     if command_type == "summary":
         await update.message.reply_text("Generating your summary...")
 
-        summary = get_transactions_summary(custom_range)
+        summary = await get_transactions_summary(update.effective_user.id, custom_range)
 
         response = [f"🧾 *Summary ({custom_range})*\n"]
 
@@ -481,60 +466,8 @@ async def command_custom_range_input(update: Update, context: ContextTypes.DEFAU
     elif command_type == "details":
         await update.message.reply_text("Fetching your transaction details...")
 
-        details = get_transactions_details(custom_range)
-
-        response = [f"🧾 *Detailed View ({custom_range})*\n"]
-
-        if details['expenses_by_category']:
-            for category, items in sorted(details['expenses_by_category'].items()):
-                response.append(f"*{category}*")
-                for item in items:
-                    response.append(f"  - ${item['amount_usd']:,.2f} — _{item['source_text']}_")
-        else:
-            response.append("_No expenses recorded for this period._")
-
-        if details['resisted']:
-            response.append("\n*Resisted*")
-            for item in details['resisted']:
-                response.append(f"  - ${item['amount_usd']:,.2f} — _{item['source_text']}_")
-
-        message_text = "\n".join(response)
-
-        # Check if message exceeds Telegram's 4096 character limit
-        if len(message_text) > 4000:
-            # Split into multiple messages
-            await update.message.reply_text(
-                f"🧾 *Detailed View ({custom_range})*\n\n"
-                f"_Your transaction list is very long. Sending it in multiple messages..._",
-                parse_mode='Markdown'
-            )
-
-            # Send chunks of the message
-            chunks = [response[0]]
-            current_chunk = []
-            current_length = 0
-
-            for line in response[1:]:
-                if current_length + len(line) + 1 > 3800:  # Leave some margin
-                    # Send current chunk
-                    await update.message.reply_text(
-                        "\n".join(current_chunk),
-                        parse_mode='Markdown'
-                    )
-                    current_chunk = []
-                    current_length = 0
-
-                current_chunk.append(line)
-                current_length += len(line) + 1  # +1 for newline
-
-            # Send any remaining chunk
-            if current_chunk:
-                await update.message.reply_text(
-                    "\n".join(current_chunk),
-                    parse_mode='Markdown'
-                )
-        else:
-            await update.message.reply_text(message_text, parse_mode='Markdown')
+        text, reply_markup = await get_first_details_page(update.effective_user.id, custom_range)
+        await update.message.reply_text(text, parse_mode='Markdown', reply_markup=reply_markup)
 
     return ConversationHandler.END
 
@@ -1,21 +1,110 @@
 import sqlite3
 import os
-from datetime import date, timedelta, datetime
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from constants import (
+    DB_PATH, DB_READER_POOL_SIZE, DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_BUSY_TIMEOUT_MS,
+    DB_STATEMENT_CACHE_SIZE, LEGACY_USER_ID, CHART_MAX_BARS, DETAILS_PAGE_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+# Dates are stored as days since 1970-01-01 and amounts as integer cents
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# dirty_from value meaning every running total needs recomputing
+ALL_DAYS = date.min.toordinal() - EPOCH_ORDINAL
+
+# One long-lived writer (SQLite allows a single writer at a time anyway) and a
+# pool of readers. In WAL mode readers keep working while a write is in progress.
+_writer = None
+_writer_lock = threading.RLock()
+_readers = queue.Queue(maxsize=DB_READER_POOL_SIZE)
 
 
 def get_db_connection():
-    """Establishes a connection to the database."""
-    conn = sqlite3.connect('expenses.db')
+    """Establishes a new, fully configured connection to the database."""
+    conn = sqlite3.connect(
+        DB_PATH,
+        check_same_thread=False,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        cached_statements=DB_STATEMENT_CACHE_SIZE,
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    # NORMAL is durable in WAL mode except for the last commits on power loss
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
     return conn
 
 
-def init_db():
+def _get_writer():
+    """Returns the shared writer connection. Call with _writer_lock held."""
+    global _writer
+    if _writer is None:
+        _writer = get_db_connection()
+    return _writer
+
+
+@contextmanager
+def write_connection():
     """
-    Initializes the database schema. This function is self-contained and
-    is called only once when the bot starts.
+    Yields the shared writer connection inside a transaction.
+
+    Commits when the block finishes and rolls back if it raises. Writers are
+    serialized by a lock, so the connection can be used from any thread.
     """
-    conn = get_db_connection()
+    with _writer_lock:
+        conn = _get_writer()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+@contextmanager
+def read_connection():
+    """Yields a pooled read-only connection, returning it to the pool afterwards."""
+    try:
+        conn = _readers.get_nowait()
+    except queue.Empty:
+        conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        # End any implicit read transaction so the WAL can be checkpointed
+        conn.rollback()
+        try:
+            _readers.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+def close_connections():
+    """Closes the writer and all pooled readers."""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+    while True:
+        try:
+            _readers.get_nowait().close()
+        except queue.Empty:
+            break
+
+
+def _migration_initial_schema(conn):
+    """Creates the original tables. Safe on databases that predate migrations."""
     cursor = conn.cursor()
     cursor.execute('''
                    CREATE TABLE IF NOT EXISTS transactions
@@ -29,21 +118,452 @@ def init_db():
                        created_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                    );
                    ''')
-    conn.commit()
-    conn.close()
+    # Parse results reused by parse_cache.py
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS parse_cache
+                   (
+                       key          TEXT PRIMARY KEY,
+                       result       TEXT NOT NULL,
+                       date_offset  INTEGER,
+                       created_at   REAL NOT NULL,
+                       last_used_at REAL NOT NULL
+                   );
+                   ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_parse_cache_last_used ON parse_cache (last_used_at)")
+    # Daily exchange rates used by fx_rates.py
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS fx_rates
+                   (
+                       date         TEXT NOT NULL,
+                       currency     TEXT NOT NULL,
+                       usd_per_unit REAL NOT NULL,
+                       PRIMARY KEY (currency, date)
+                   );
+                   ''')
 
 
-def add_transaction(transaction_data, source_text):
-    """Adds a parsed transaction to the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO transactions (type, category, amount_usd, date, source_text) VALUES (?, ?, ?, ?, ?)",
-        (transaction_data['type'], transaction_data['category'], transaction_data['amount_usd'],
-         transaction_data['date'], source_text)
+def _migration_report_indexes(conn):
+    """
+    Adds indexes for the report queries, which all filter on type and a date
+    range. Including category and amount_usd makes summaries index-only.
+    """
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_transactions_type_date "
+        "ON transactions (type, date, category, amount_usd)"
+    )
+
+
+def _migration_date_first_index(conn):
+    """
+    Adds a date-first covering index for reports that read both transaction
+    types in one pass and only filter on the date range.
+    """
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_transactions_date_type "
+        "ON transactions (date, type, category, amount_usd)"
+    )
+
+
+def _migration_daily_totals(conn):
+    """
+    Adds the daily_totals rollup that report queries read instead of raw
+    transactions. It is rebuilt per user by _migration_user_partitioning.
+    """
+    conn.execute('''
+                 CREATE TABLE IF NOT EXISTS daily_totals
+                 (
+                     date     TEXT    NOT NULL,
+                     type     TEXT    NOT NULL,
+                     category TEXT    NOT NULL,
+                     total    REAL    NOT NULL,
+                     count    INTEGER NOT NULL,
+                     PRIMARY KEY (date, type, category)
+                 ) WITHOUT ROWID;
+                 ''')
+
+
+def _migration_cumulative_totals(conn):
+    """
+    Adds cumulative_totals, the per-(type, category) running totals that let
+    any date range be summed with two lookups. It is rebuilt per user by
+    _migration_user_partitioning.
+    """
+    conn.execute('''
+                 CREATE TABLE IF NOT EXISTS cumulative_totals
+                 (
+                     type     TEXT    NOT NULL,
+                     category TEXT    NOT NULL,
+                     date     TEXT    NOT NULL,
+                     total    REAL    NOT NULL,
+                     count    INTEGER NOT NULL,
+                     PRIMARY KEY (type, category, date)
+                 ) WITHOUT ROWID;
+                 ''')
+    # Single row holding the earliest date whose running totals are stale
+    conn.execute('''
+                 CREATE TABLE IF NOT EXISTS cumulative_state
+                 (
+                     id         INTEGER PRIMARY KEY CHECK (id = 1),
+                     dirty_from TEXT
+                 );
+                 ''')
+    conn.execute("INSERT OR IGNORE INTO cumulative_state (id, dirty_from) VALUES (1, '0000-01-01')")
+
+
+def _migration_user_partitioning(conn):
+    """
+    Gives every transaction an owner and partitions all report tables by it.
+
+    Existing rows are assigned to LEGACY_USER_ID, which migrate() checks is
+    set before applying anything. Indexes lead with user_id so a report only
+    reads the requesting user's rows. The rollups are rebuilt by
+    _migration_integer_storage.
+    """
+    owner = _legacy_user_id() or 0
+    conn.execute(f"ALTER TABLE transactions ADD COLUMN user_id INTEGER NOT NULL DEFAULT {owner}")
+    conn.execute("DROP INDEX IF EXISTS idx_transactions_type_date")
+    conn.execute("DROP INDEX IF EXISTS idx_transactions_date_type")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_type_date "
+        "ON transactions (user_id, type, date, category, amount_usd)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_date_type "
+        "ON transactions (user_id, date, type, category, amount_usd)"
+    )
+
+    conn.execute("DROP TABLE IF EXISTS daily_totals")
+    conn.execute('''
+                 CREATE TABLE daily_totals
+                 (
+                     user_id  INTEGER NOT NULL,
+                     date     TEXT    NOT NULL,
+                     type     TEXT    NOT NULL,
+                     category TEXT    NOT NULL,
+                     total    REAL    NOT NULL,
+                     count    INTEGER NOT NULL,
+                     PRIMARY KEY (user_id, date, type, category)
+                 ) WITHOUT ROWID;
+                 ''')
+    conn.execute("DROP TABLE IF EXISTS cumulative_totals")
+    conn.execute('''
+                 CREATE TABLE cumulative_totals
+                 (
+                     user_id  INTEGER NOT NULL,
+                     type     TEXT    NOT NULL,
+                     category TEXT    NOT NULL,
+                     date     TEXT    NOT NULL,
+                     total    REAL    NOT NULL,
+                     count    INTEGER NOT NULL,
+                     PRIMARY KEY (user_id, type, category, date)
+                 ) WITHOUT ROWID;
+                 ''')
+    # Earliest date whose running totals are stale, per user
+    conn.execute("DROP TABLE IF EXISTS cumulative_state")
+    conn.execute('''
+                 CREATE TABLE cumulative_state
+                 (
+                     user_id    INTEGER PRIMARY KEY,
+                     dirty_from TEXT
+                 );
+                 ''')
+
+
+def _migration_integer_storage(conn):
+    """
+    Stores amounts as integer cents and dates as integer days since
+    1970-01-01, so sums are exact, range scans compare integers and weeks
+    and months are bucketed arithmetically.
+    """
+    conn.execute('''
+                 CREATE TABLE transactions_new
+                 (
+                     id           INTEGER PRIMARY KEY AUTOINCREMENT,
+                     user_id      INTEGER                                      NOT NULL,
+                     type         TEXT CHECK (type IN ('expense', 'resisted')) NOT NULL,
+                     category     TEXT                                         NOT NULL,
+                     amount_cents INTEGER                                      NOT NULL,
+                     day          INTEGER                                      NOT NULL,
+                     source_text  TEXT                                         NOT NULL,
+                     created_at   TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                 );
+                 ''')
+    conn.execute("""
+        INSERT INTO transactions_new (id, user_id, type, category, amount_cents, day, source_text, created_at)
+        SELECT id, user_id, type, category, CAST(ROUND(amount_usd * 100) AS INTEGER),
+               CAST(julianday(date) - julianday('1970-01-01') AS INTEGER), source_text, created_at
+        FROM transactions
+    """)
+    conn.execute("DROP TABLE transactions")
+    conn.execute("ALTER TABLE transactions_new RENAME TO transactions")
+    conn.execute(
+        "CREATE INDEX idx_transactions_user_type_day "
+        "ON transactions (user_id, type, day, category, amount_cents)"
+    )
+    conn.execute(
+        "CREATE INDEX idx_transactions_user_day_type "
+        "ON transactions (user_id, day, type, category, amount_cents)"
+    )
+
+    conn.execute("DROP TABLE daily_totals")
+    conn.execute('''
+                 CREATE TABLE daily_totals
+                 (
+                     user_id     INTEGER NOT NULL,
+                     day         INTEGER NOT NULL,
+                     type        TEXT    NOT NULL,
+                     category    TEXT    NOT NULL,
+                     total_cents INTEGER NOT NULL,
+                     count       INTEGER NOT NULL,
+                     PRIMARY KEY (user_id, day, type, category)
+                 ) WITHOUT ROWID;
+                 ''')
+    conn.execute("DROP TABLE cumulative_totals")
+    conn.execute('''
+                 CREATE TABLE cumulative_totals
+                 (
+                     user_id     INTEGER NOT NULL,
+                     type        TEXT    NOT NULL,
+                     category    TEXT    NOT NULL,
+                     day         INTEGER NOT NULL,
+                     total_cents INTEGER NOT NULL,
+                     count       INTEGER NOT NULL,
+                     PRIMARY KEY (user_id, type, category, day)
+                 ) WITHOUT ROWID;
+                 ''')
+    conn.execute("DROP TABLE cumulative_state")
+    conn.execute('''
+                 CREATE TABLE cumulative_state
+                 (
+                     user_id    INTEGER PRIMARY KEY,
+                     dirty_from INTEGER
+                 );
+                 ''')
+    _rebuild_daily_totals(conn)
+    _rebuild_cumulative_totals(conn)
+
+
+# Applied in order; PRAGMA user_version records how many have run.
+# Only ever append to this list.
+MIGRATIONS = [
+    _migration_initial_schema,
+    _migration_report_indexes,
+    _migration_date_first_index,
+    _migration_daily_totals,
+    _migration_cumulative_totals,
+    _migration_user_partitioning,
+    _migration_integer_storage,
+]
+
+
+def _legacy_user_id():
+    """Returns LEGACY_USER_ID as an integer, or None when it isn't set."""
+    if not LEGACY_USER_ID:
+        return None
+    try:
+        return int(LEGACY_USER_ID)
+    except ValueError:
+        raise RuntimeError(f"LEGACY_USER_ID must be a Telegram user id, got {LEGACY_USER_ID!r}") from None
+
+
+def _check_legacy_owner(conn, pending):
+    """
+    Fails when _migration_user_partitioning is pending and there are
+    transactions for it to assign but no owner is configured.
+    """
+    if _migration_user_partitioning not in pending:
+        return
+    owner = _legacy_user_id()
+    has_table = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions'").fetchone()
+    if owner is None and has_table and conn.execute("SELECT 1 FROM transactions LIMIT 1").fetchone():
+        raise RuntimeError(
+            "This database has transactions from before they were stored per user: "
+            "set LEGACY_USER_ID to the Telegram id of the user they belong to"
+        )
+
+
+def migrate(conn):
+    """
+    Brings the schema up to date, one transaction per migration.
+
+    Preconditions are checked before the first migration runs, so a failed
+    check leaves the database untouched rather than half upgraded.
+    Returns: number of migrations applied.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    pending = MIGRATIONS[version:]
+    _check_legacy_owner(conn, pending)
+    for number, migration in enumerate(pending, start=version + 1):
+        logger.info(f"Applying database migration {number}: {migration.__name__}")
+        conn.execute("BEGIN")
+        try:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    if pending:
+        # Refresh planner statistics so the new indexes get used
+        conn.execute("ANALYZE")
+        conn.commit()
+    return len(pending)
+
+
+def init_db():
+    """
+    Initializes the database schema. This function is self-contained and
+    is called only once when the bot starts.
+    """
+    with _writer_lock:
+        migrate(_get_writer())
+
+
+def add_transactions(user_id, transactions, source_text):
+    """
+    Adds several parsed transactions from one message in a single commit,
+    updating the daily_totals rollup in the same transaction.
+    """
+    add_transaction_groups([(user_id, transactions, source_text)])
+
+
+def to_day(iso_date):
+    """Converts a date or YYYY-MM-DD string to days since 1970-01-01."""
+    if isinstance(iso_date, str):
+        iso_date = date.fromisoformat(iso_date)
+    return iso_date.toordinal() - EPOCH_ORDINAL
+
+
+def from_day(day):
+    """Converts days since 1970-01-01 back to a YYYY-MM-DD string."""
+    return date.fromordinal(day + EPOCH_ORDINAL).isoformat()
+
+
+def to_cents(amount):
+    """Converts a dollar amount to integer cents."""
+    return round(float(amount) * 100)
+
+
+def add_transaction_groups(groups):
+    """
+    Adds the transactions of several messages in a single commit.
+
+    Args:
+        groups: List of (user_id, transactions, source_text) tuples, one per message
+    """
+    rows = [
+        (user_id, transaction_data['type'], transaction_data['category'],
+         to_cents(transaction_data['amount_usd']), to_day(transaction_data['date']), source_text)
+        for user_id, transactions, source_text in groups
+        for transaction_data in transactions
+    ]
+    if not rows:
+        return
+    with write_connection() as conn:
+        conn.executemany(
+            "INSERT INTO transactions (user_id, type, category, amount_cents, day, source_text) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        conn.executemany("""
+            INSERT INTO daily_totals (user_id, type, category, total_cents, day, count) VALUES (?, ?, ?, ?, ?, 1)
+            ON CONFLICT (user_id, day, type, category)
+            DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1
+        """, [row[:5] for row in rows])
+        # Running totals from each user's earliest new day onwards are now
+        # stale; sync_cumulative_totals() catches them up in the background
+        earliest = {}
+        for row in rows:
+            earliest[row[0]] = min(earliest.get(row[0], row[4]), row[4])
+        for user_id, first_day in earliest.items():
+            _mark_cumulative_dirty(conn, user_id, first_day)
+
+
+def _rebuild_daily_totals(conn):
+    """Recomputes daily_totals from the transactions table."""
+    conn.execute("DELETE FROM daily_totals")
+    conn.execute("""
+        INSERT INTO daily_totals (user_id, day, type, category, total_cents, count)
+        SELECT user_id, day, type, category, SUM(amount_cents), COUNT(*)
+        FROM transactions
+        GROUP BY user_id, day, type, category
+    """)
+
+
+def _rebuild_cumulative_totals(conn):
+    """Marks every user's running totals stale and recomputes them."""
+    conn.execute("DELETE FROM cumulative_totals")
+    conn.execute("DELETE FROM cumulative_state")
+    conn.execute(
+        "INSERT INTO cumulative_state (user_id, dirty_from) SELECT DISTINCT user_id, ? FROM daily_totals",
+        (ALL_DAYS,)
     )
-    conn.commit()
-    conn.close()
+    _sync_cumulative_totals(conn)
+
+
+def rebuild_daily_totals():
+    """
+    Rebuilds the daily_totals rollup and the running totals derived from it
+    from scratch, e.g. after transactions were backfilled or edited outside
+    the bot.
+    """
+    with write_connection() as conn:
+        _rebuild_daily_totals(conn)
+        _rebuild_cumulative_totals(conn)
+        return conn.execute("SELECT COUNT(*) FROM daily_totals").fetchone()[0]
+
+
+def _mark_cumulative_dirty(conn, user_id, from_day):
+    """Records that a user's running totals from from_day onwards need recomputing."""
+    conn.execute("""
+        INSERT INTO cumulative_state (user_id, dirty_from) VALUES (?, ?)
+        ON CONFLICT (user_id)
+        DO UPDATE SET dirty_from = MIN(COALESCE(dirty_from, excluded.dirty_from), excluded.dirty_from)
+    """, (user_id, from_day))
+
+
+def _sync_cumulative_totals(conn):
+    """
+    Recomputes stale running totals from daily_totals.
+
+    For every user with stale totals, only days on or after their dirty_from
+    are rewritten, each continuing from the last clean running total of its
+    (type, category).
+    Returns: number of users whose running totals were synced.
+    """
+    stale = conn.execute(
+        "SELECT user_id, dirty_from FROM cumulative_state WHERE dirty_from IS NOT NULL"
+    ).fetchall()
+
+    for user_id, dirty_from in stale:
+        conn.execute("DELETE FROM cumulative_totals WHERE user_id = ? AND day >= ?", (user_id, dirty_from))
+        conn.execute("""
+            INSERT INTO cumulative_totals (user_id, type, category, day, total_cents, count)
+            SELECT d.user_id, d.type, d.category, d.day,
+                   COALESCE(base.total_cents, 0) + SUM(d.total_cents) OVER running,
+                   COALESCE(base.count, 0) + SUM(d.count) OVER running
+            FROM daily_totals d
+            LEFT JOIN cumulative_totals base
+                ON base.user_id = d.user_id AND base.type = d.type AND base.category = d.category
+                AND base.day = (SELECT MAX(c.day) FROM cumulative_totals c
+                                WHERE c.user_id = d.user_id AND c.type = d.type
+                                AND c.category = d.category AND c.day < :dirty_from)
+            WHERE d.user_id = :user AND d.day >= :dirty_from
+            WINDOW running AS (PARTITION BY d.type, d.category ORDER BY d.day)
+        """, {'user': user_id, 'dirty_from': dirty_from})
+        conn.execute("UPDATE cumulative_state SET dirty_from = NULL WHERE user_id = ?", (user_id,))
+    return len(stale)
+
+
+def sync_cumulative_totals():
+    """
+    Brings the running totals up to date with late-dated inserts.
+
+    Run periodically in the background; summaries fall back to the daily
+    rollup for ranges that reach into stale dates until this has run.
+    """
+    with write_connection() as conn:
+        return _sync_cumulative_totals(conn)
 
 
 def parse_date_range(time_range_str):
@@ -80,145 +600,260 @@ def parse_date_range(time_range_str):
     return today, today  # Default fallback
 
 
-def get_transactions_summary(time_range_str):
-    """Queries the database for a summary of transactions."""
-    start_date, end_date = parse_date_range(time_range_str)
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Expenses
-    cursor.execute(
-        "SELECT category, SUM(amount_usd) as total FROM transactions WHERE type = 'expense' AND date BETWEEN ? AND ? GROUP BY category",
-        (start_date.isoformat(), end_date.isoformat()))
-    expenses_by_category = {row['category']: row['total'] for row in cursor.fetchall()}
-
-    # Total Resisted
-    cursor.execute("SELECT SUM(amount_usd) as total FROM transactions WHERE type = 'resisted' AND date BETWEEN ? AND ?",
-                   (start_date.isoformat(), end_date.isoformat()))
-    total_resisted_row = cursor.fetchone()
-    total_resisted = total_resisted_row['total'] if total_resisted_row and total_resisted_row[
-        'total'] is not None else 0
-
-    conn.close()
+def _get_summary_from_cumulative(conn, user_id, start_date, end_date):
+    """
+    Sums a date range from a user's running totals: for every (type,
+    category), the last running total on or before the end minus the last
+    one before the start. The cost doesn't depend on how long the range is.
+    """
+    return conn.execute("""
+        WITH RECURSIVE keys(type, category) AS (
+            SELECT * FROM (SELECT type, category FROM cumulative_totals WHERE user_id = :user
+                           ORDER BY type, category LIMIT 1)
+            UNION ALL
+            -- Skip-scan to the next (type, category) in the primary key
+            SELECT (SELECT c.type FROM cumulative_totals c
+                    WHERE c.user_id = :user AND (c.type, c.category) > (keys.type, keys.category)
+                    ORDER BY c.type, c.category LIMIT 1),
+                   (SELECT c.category FROM cumulative_totals c
+                    WHERE c.user_id = :user AND (c.type, c.category) > (keys.type, keys.category)
+                    ORDER BY c.type, c.category LIMIT 1)
+            FROM keys WHERE keys.type IS NOT NULL
+        ),
+        bounds AS (
+            SELECT keys.type, keys.category,
+                   (SELECT MAX(c.day) FROM cumulative_totals c
+                    WHERE c.user_id = :user AND c.type = keys.type AND c.category = keys.category
+                    AND c.day <= :end) AS end_day,
+                   (SELECT MAX(c.day) FROM cumulative_totals c
+                    WHERE c.user_id = :user AND c.type = keys.type AND c.category = keys.category
+                    AND c.day < :start) AS before_day
+            FROM keys WHERE keys.type IS NOT NULL
+        )
+        SELECT bounds.type, bounds.category,
+               COALESCE(e.total_cents, 0) - COALESCE(b.total_cents, 0) AS total_cents,
+               COALESCE(e.count, 0) - COALESCE(b.count, 0) AS count
+        FROM bounds
+        LEFT JOIN cumulative_totals e
+            ON e.user_id = :user AND e.type = bounds.type AND e.category = bounds.category
+            AND e.day = bounds.end_day
+        LEFT JOIN cumulative_totals b
+            ON b.user_id = :user AND b.type = bounds.type AND b.category = bounds.category
+            AND b.day = bounds.before_day
+    """, {'user': user_id, 'start': to_day(start_date), 'end': to_day(end_date)}).fetchall()
+
+
+def _get_summary_from_rollup(conn, user_id, start_date, end_date):
+    """Sums a date range from a user's daily rollup, one row per day and category."""
+    # Expenses per category and resisted totals in a single pass over
+    # the daily rollup, so the cost depends on the number of days
+    rows = conn.execute("""
+        SELECT category,
+               SUM(CASE WHEN type = 'expense' THEN total_cents END) AS expenses,
+               SUM(CASE WHEN type = 'resisted' THEN total_cents ELSE 0 END) AS resisted
+        FROM daily_totals
+        WHERE user_id = ? AND day BETWEEN ? AND ?
+        GROUP BY category
+    """, (user_id, to_day(start_date), to_day(end_date))).fetchall()
 
     return {
-        'expenses_by_category': expenses_by_category,
-        'total_resisted': total_resisted
+        'expenses_by_category': {
+            row['category']: row['expenses'] / 100 for row in rows if row['expenses'] is not None
+        },
+        'total_resisted': sum(row['resisted'] for row in rows) / 100
     }
 
 
-def get_transactions_details(time_range_str):
-    """Queries the database for a detailed list of transactions."""
+def get_transactions_summary(user_id, time_range_str):
+    """Queries the database for a summary of a user's transactions."""
     start_date, end_date = parse_date_range(time_range_str)
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Expenses
-    cursor.execute(
-        "SELECT category, amount_usd, source_text FROM transactions WHERE type = 'expense' AND date BETWEEN ? AND ? ORDER BY category, created_at",
-        (start_date.isoformat(), end_date.isoformat()))
-    expenses = cursor.fetchall()
-
-    # Resisted
-    cursor.execute(
-        "SELECT amount_usd, source_text FROM transactions WHERE type = 'resisted' AND date BETWEEN ? AND ? ORDER BY created_at",
-        (start_date.isoformat(), end_date.isoformat()))
-    resisted = cursor.fetchall()
-
-    conn.close()
+    with read_connection() as conn:
+        state = conn.execute("SELECT dirty_from FROM cumulative_state WHERE user_id = ?", (user_id,)).fetchone()
+        if state is not None and state[0] is not None and state[0] <= to_day(end_date):
+            # Running totals inside this range are stale until the next sync
+            return _get_summary_from_rollup(conn, user_id, start_date, end_date)
+        rows = _get_summary_from_cumulative(conn, user_id, start_date, end_date)
 
     expenses_by_category = {}
-    for expense in expenses:
-        category = expense['category']
-        if category not in expenses_by_category:
-            expenses_by_category[category] = []
-        expenses_by_category[category].append(expense)
+    resisted_cents = 0
+    for row in rows:
+        if row['count'] <= 0:
+            continue
+        if row['type'] == 'expense':
+            expenses_by_category[row['category']] = row['total_cents'] / 100
+        else:
+            resisted_cents += row['total_cents']
 
     return {
         'expenses_by_category': expenses_by_category,
-        'resisted': resisted
+        'total_resisted': resisted_cents / 100
     }
 
 
-def get_transactions_time_series(time_range_str, interval='day'):
+def get_transactions_page(user_id, start_date, end_date, after=None, before=None, page_size=DETAILS_PAGE_SIZE):
     """
-    Gets transactions grouped by time for charts.
+    Gets one page of a user's transactions in a date range, ordered by
+    (day, type, id) to follow idx_transactions_user_day_type.
+
+    Pages are found by keyset rather than OFFSET: `after` is the key of the
+    last row on the current page to get the next one, `before` the key of
+    its first row to get the previous one. Every page costs an index seek
+    and page_size rows, however deep into the range it is.
 
     Args:
-        time_range_str: Time range specification
-        interval: 'day', 'week', or 'month' for grouping
+        user_id: Telegram id of the user
+        start_date, end_date: Inclusive date range
+        after, before: (day, type, id) key from a page's rows, or neither
+            for the first page
+        page_size: Rows per page
 
     Returns:
-        Dictionary with dates, expenses, and resisted amounts
+        Dictionary with rows (id, day, date, type, category, amount_usd,
+        source_text) and whether there are next and previous pages
     """
-    start_date, end_date = parse_date_range(time_range_str)
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    params = {'user': user_id, 'start': to_day(start_date), 'end': to_day(end_date), 'limit': page_size + 1}
+    where = "user_id = :user AND day BETWEEN :start AND :end"
+    order = "day, type, id"
+    if after is not None:
+        where += " AND (day, type, id) > (:day, :type, :id)"
+        params.update(day=after[0], type=after[1], id=after[2])
+    elif before is not None:
+        where += " AND (day, type, id) < (:day, :type, :id)"
+        params.update(day=before[0], type=before[1], id=before[2])
+        order = "day DESC, type DESC, id DESC"
+
+    with read_connection() as conn:
+        # One extra row tells whether there is another page in this direction
+        rows = conn.execute(f"""
+            SELECT id, day, type, category, amount_cents / 100.0 AS amount_usd, source_text
+            FROM transactions
+            WHERE {where}
+            ORDER BY {order}
+            LIMIT :limit
+        """, params).fetchall()
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if before is not None:
+        rows.reverse()
+    return {
+        'rows': [dict(row, date=from_day(row['day'])) for row in rows],
+        'has_next': has_more if before is None else True,
+        'has_previous': has_more if before is not None else after is not None,
+    }
+
+
+def _month_start_expression(day):
+    """
+    SQL expression for the first day of the month containing `day`, in pure
+    integer arithmetic (the civil-from-days algorithm, with March-based years).
+    """
+    day_of_era = f"(({day} + 719468) % 146097)"
+    year_of_era = f"(({day_of_era} - {day_of_era} / 1460 + {day_of_era} / 36524 - {day_of_era} / 146096) / 365)"
+    day_of_year = f"({day_of_era} - (365 * {year_of_era} + {year_of_era} / 4 - {year_of_era} / 100))"
+    month_index = f"((5 * {day_of_year} + 2) / 153)"
+    return f"({day} - {day_of_year} + (153 * {month_index} + 2) / 5)"
+
 
-    # Format the date based on the interval
+# SQL expression mapping a row's day number to the first day of its period
+PERIOD_EXPRESSIONS = {
+    'day': "day",
+    # Monday of the row's week; day 0 (1970-01-01) was a Thursday. SQLite's %
+    # keeps the sign of the dividend, so it is wrapped to stay 0-6 before 1970
+    'week': "(day - ((day + 3) % 7 + 7) % 7)",
+    'month': _month_start_expression("day"),
+}
+
+# Time series intervals, finest first
+INTERVALS = ('day', 'week', 'month')
+
+
+def count_periods(start_date, end_date, interval):
+    """Returns how many day, week or month periods overlap the range from start_date to end_date."""
     if interval == 'day':
-        date_format = '%Y-%m-%d'
-        group_by = "date"
-    elif interval == 'week':
-        date_format = '%Y-%W'  # Year-Week number
-        group_by = "strftime('%Y-%W', date)"
-    else:  # month
-        date_format = '%Y-%m'
-        group_by = "strftime('%Y-%m', date)"
-
-    # Get expenses by date
-    cursor.execute(f"""
-        SELECT {group_by} as period, SUM(amount_usd) as total 
-        FROM transactions 
-        WHERE type = 'expense' AND date BETWEEN ? AND ?
-        GROUP BY period
-        ORDER BY period
-    """, (start_date.isoformat(), end_date.isoformat()))
-
-    expenses_by_date = {}
-    for row in cursor.fetchall():
-        expenses_by_date[row['period']] = row['total']
-
-    # Get resisted by date
-    cursor.execute(f"""
-        SELECT {group_by} as period, SUM(amount_usd) as total 
-        FROM transactions 
-        WHERE type = 'resisted' AND date BETWEEN ? AND ?
-        GROUP BY period
-        ORDER BY period
-    """, (start_date.isoformat(), end_date.isoformat()))
-
-    resisted_by_date = {}
-    for row in cursor.fetchall():
-        resisted_by_date[row['period']] = row['total']
-
-    # Combine into a single dataset
-    all_periods = sorted(set(list(expenses_by_date.keys()) + list(resisted_by_date.keys())))
-
-    # For nice display, convert period format if needed
+        return (end_date - start_date).days + 1
     if interval == 'week':
-        # Convert YYYY-WW to dates representing the Monday of that week
-        formatted_dates = []
-        for period in all_periods:
-            year, week = period.split('-')
-            # Create a date for the first day of that week
-            d = datetime.strptime(f'{year}-{week}-1', '%Y-%W-%w')
-            formatted_dates.append(d.strftime('%Y-%m-%d'))
-        dates = formatted_dates
-    elif interval == 'month':
-        # Add day to make a valid date
-        dates = [f"{period}-01" for period in all_periods]
-    else:
-        dates = all_periods
+        return ((end_date - timedelta(days=end_date.weekday()))
+                - (start_date - timedelta(days=start_date.weekday()))).days // 7 + 1
+    return (end_date.year - start_date.year) * 12 + end_date.month - start_date.month + 1
+
+
+def choose_interval(start_date, end_date, interval='day', max_periods=CHART_MAX_BARS):
+    """
+    Picks the interval for a time series: the requested one, or the next
+    coarser one while the range would have more than max_periods periods.
+    Unknown intervals and ranges too long even by month give 'month'.
+    """
+    if interval not in INTERVALS:
+        return 'month'
+    for candidate in INTERVALS[INTERVALS.index(interval):]:
+        if count_periods(start_date, end_date, candidate) <= max_periods:
+            return candidate
+    return 'month'
+
 
-    # Get values with 0 for missing dates
-    expenses = [expenses_by_date.get(period, 0) for period in all_periods]
-    resisted = [resisted_by_date.get(period, 0) for period in all_periods]
+def get_period_totals(user_id, start_date, end_date, interval):
+    """
+    Sums a user's daily totals by period, for the time series functions.
+
+    Args:
+        user_id: Telegram id of the user
+        start_date, end_date: Inclusive date range
+        interval: 'day', 'week', or 'month'
+
+    Returns:
+        Rows of (period, expenses, resisted), ordered by period: the day
+        number of the period's first day and the sums in cents. Periods
+        without transactions are left out.
+    """
+    with read_connection() as conn:
+        # Both series in a single pass over the daily rollup, already
+        # aligned by period
+        return conn.execute(f"""
+            SELECT {PERIOD_EXPRESSIONS[interval]} AS period,
+                   SUM(CASE WHEN type = 'expense' THEN total_cents ELSE 0 END) AS expenses,
+                   SUM(CASE WHEN type = 'resisted' THEN total_cents ELSE 0 END) AS resisted
+            FROM daily_totals
+            WHERE user_id = ? AND day BETWEEN ? AND ?
+            GROUP BY period
+            ORDER BY period
+        """, (user_id, to_day(start_date), to_day(end_date))).fetchall()
+
+
+def get_transactions_time_series(user_id, time_range_str, interval='day'):
+    """
+    Gets a user's transactions grouped by time for charts.
+
+    Only periods with transactions are included; time_series.get_time_series
+    gives every period in the range as NumPy arrays.
+
+    Args:
+        user_id: Telegram id of the user
+        time_range_str: Time range specification
+        interval: 'day', 'week', or 'month' for grouping; coarsened by
+            choose_interval() when the range has too many periods to chart
 
-    conn.close()
+    Returns:
+        Dictionary with dates (first day of each period), expenses, and
+        resisted amounts, aligned by index, and the interval used
+    """
+    start_date, end_date = parse_date_range(time_range_str)
+    interval = choose_interval(start_date, end_date, interval)
+    rows = get_period_totals(user_id, start_date, end_date, interval)
 
     return {
-        'dates': dates,
-        'expenses': expenses,
-        'resisted': resisted
-    }
\ No newline at end of file
+        'dates': [from_day(row['period']) for row in rows],
+        'expenses': [row['expenses'] / 100 for row in rows],
+        'resisted': [row['resisted'] / 100 for row in rows],
+        'interval': interval,
+    }
+
+
+if __name__ == '__main__':
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    if sys.argv[1:] == ['rebuild-rollups']:
+        logger.info(f"Rebuilt daily_totals: {rebuild_daily_totals()} rows")
+    else:
+        print("Usage: python db.py rebuild-rollups")
@@ -0,0 +1,164 @@
+"""Awaitable facade over db.py for use inside bot handlers.
+
+Every call runs on a small dedicated thread pool, so a slow query or a
+locked database never blocks the event loop. The number of calls handed to
+the pool at once is capped; further callers wait on the event loop until a
+slot frees up.
+
+Inserts go through a group-commit queue: transactions arriving within
+DB_WRITE_BATCH_WINDOW_MS of each other are written in one SQLite
+transaction, and each caller is only answered once that commit is done.
+"""
+import time
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+from batching import LazySemaphore, MicroBatcher
+from constants import (
+    DB_EXECUTOR_THREADS, DB_MAX_QUEUED_CALLS, DB_WRITE_BATCH_WINDOW_MS, DB_WRITE_BATCH_MAX_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_THREADS, thread_name_prefix="db")
+
+_write_stats = {'commits': 0, 'messages': 0, 'max_batch_size': 0, 'commit_seconds': 0.0, 'max_commit_seconds': 0.0}
+STATS_LOG_EVERY = 100
+
+# Bounds how many calls are queued on the pool
+_queue_slots = LazySemaphore(DB_MAX_QUEUED_CALLS)
+
+
+async def run_db(func, *args, **kwargs):
+    """Runs a blocking database function on the DB thread pool and awaits it."""
+    async with _queue_slots.get():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def _timed_commit(groups):
+    """Runs db.add_transaction_groups and returns how long it took, in seconds."""
+    started = time.perf_counter()
+    db.add_transaction_groups(groups)
+    return time.perf_counter() - started
+
+
+def _record_commit(batch_size, seconds):
+    """Updates the group-commit metrics after a successful commit."""
+    _write_stats['commits'] += 1
+    _write_stats['messages'] += batch_size
+    _write_stats['max_batch_size'] = max(_write_stats['max_batch_size'], batch_size)
+    _write_stats['commit_seconds'] += seconds
+    _write_stats['max_commit_seconds'] = max(_write_stats['max_commit_seconds'], seconds)
+
+    if _write_stats['commits'] % STATS_LOG_EVERY == 0:
+        stats = get_write_stats()
+        logger.info(f"Group commit: {stats['commits']} commits, {stats['avg_batch_size']:.1f} messages per commit "
+                    f"(max {stats['max_batch_size']}), {stats['avg_commit_ms']:.1f} ms per commit "
+                    f"(max {stats['max_commit_ms']:.1f} ms)")
+
+
+async def _commit_writes(batch):
+    """
+    Commits a batch of ((user_id, transactions, source_text), future) pairs together.
+
+    If the shared commit fails, every message is retried in its own commit so
+    one bad row doesn't fail the others.
+    """
+    try:
+        seconds = await run_db(_timed_commit, [group for group, _ in batch])
+    except Exception as e:
+        if len(batch) == 1:
+            if not batch[0][1].done():
+                batch[0][1].set_exception(e)
+            return
+        logger.warning(f"Group commit of {len(batch)} messages failed ({e}), retrying one by one")
+        for group, future in batch:
+            try:
+                seconds = await run_db(_timed_commit, [group])
+            except Exception as single_error:
+                if not future.done():
+                    future.set_exception(single_error)
+                continue
+            _record_commit(1, seconds)
+            if not future.done():
+                future.set_result(None)
+        return
+
+    _record_commit(len(batch), seconds)
+    for _, future in batch:
+        if not future.done():
+            future.set_result(None)
+
+
+# Inserts waiting for the next group commit
+_write_batcher = MicroBatcher(_commit_writes, DB_WRITE_BATCH_WINDOW_MS, DB_WRITE_BATCH_MAX_SIZE)
+
+
+async def add_transactions(user_id, transactions, source_text):
+    """
+    Awaitable db.add_transactions with group commit.
+
+    The transactions are queued and written together with any others that
+    arrive within DB_WRITE_BATCH_WINDOW_MS (up to DB_WRITE_BATCH_MAX_SIZE
+    messages). Returns once the commit holding them has finished, and raises
+    if it failed.
+    """
+    if not transactions:
+        return
+    await _write_batcher.submit((user_id, transactions, source_text))
+
+
+def get_write_stats():
+    """Returns batch-size and commit-latency metrics for the group-commit queue."""
+    commits = _write_stats['commits']
+    return {
+        'commits': commits,
+        'messages': _write_stats['messages'],
+        'pending': _write_batcher.pending,
+        'avg_batch_size': _write_stats['messages'] / commits if commits else 0.0,
+        'max_batch_size': _write_stats['max_batch_size'],
+        'avg_commit_ms': _write_stats['commit_seconds'] * 1000 / commits if commits else 0.0,
+        'max_commit_ms': _write_stats['max_commit_seconds'] * 1000,
+    }
+
+
+async def get_transactions_summary(user_id, time_range_str):
+    """Awaitable db.get_transactions_summary."""
+    return await run_db(db.get_transactions_summary, user_id, time_range_str)
+
+
+async def get_transactions_page(user_id, start_date, end_date, after=None, before=None):
+    """Awaitable db.get_transactions_page."""
+    return await run_db(db.get_transactions_page, user_id, start_date, end_date, after=after, before=before)
+
+
+async def get_transactions_time_series(user_id, time_range_str, interval='day'):
+    """Awaitable db.get_transactions_time_series."""
+    return await run_db(db.get_transactions_time_series, user_id, time_range_str, interval)
+
+
+def _get_time_series(user_id, time_range_str, interval):
+    """time_series.get_time_series, importing it on first use so numpy stays out of bot startup."""
+    import time_series
+    return time_series.get_time_series(user_id, time_range_str, interval)
+
+
+async def get_time_series(user_id, time_range_str, interval='day'):
+    """Awaitable time_series.get_time_series; the first call loads numpy on a DB thread, not the event loop."""
+    return await run_db(_get_time_series, user_id, time_range_str, interval)
+
+
+async def sync_cumulative_totals():
+    """Awaitable db.sync_cumulative_totals."""
+    return await run_db(db.sync_cumulative_totals)
+
+
+async def shutdown():
+    """Commits queued writes, waits for running calls, stops the DB threads and closes the database."""
+    await _write_batcher.drain()
+    _executor.shutdown(wait=True)
+    db.close_connections()
@@ -0,0 +1,125 @@
+"""Paginated /details listing, navigated with inline Previous/Next buttons.
+
+Each page is one keyset query (db.get_transactions_page) for at most
+DETAILS_PAGE_SIZE transactions, shown in a single message that the buttons
+edit in place. The buttons' callback data carries everything needed to fetch
+the neighbouring page: the resolved date range and the key of the page's
+first or last row. An old message therefore keeps paging through the range
+it was opened for, and no per-user state is kept between taps.
+"""
+import logging
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+from telegram.helpers import escape_markdown
+
+from constants import TIME_RANGES, DETAILS_MAX_SOURCE_CHARS
+from db import parse_date_range, to_day, from_day
+from db_async import get_transactions_page
+
+logger = logging.getLogger(__name__)
+
+# Callback data: dpage:<timeframe>:<start day>:<end day>:<n|p>:<day>:<type code>:<id>:<page>,
+# kept under Telegram's 64 byte limit
+CALLBACK_PREFIX = "dpage"
+# Transaction types by the letter standing for them in callback data
+TYPE_CODES = {'e': 'expense', 'r': 'resisted'}
+
+
+def _title(timeframe, start_date, end_date):
+    """Names a range after its built-in timeframe, or by its dates for custom ranges."""
+    return TIME_RANGES.get(timeframe) or f"{start_date} to {end_date}"
+
+
+def _callback_data(timeframe, start_day, end_day, direction, row, page):
+    """Encodes a page request anchored on a row's (day, type, id) key."""
+    return ":".join(str(part) for part in (
+        CALLBACK_PREFIX, timeframe, start_day, end_day, direction, row['day'], row['type'][0], row['id'], page
+    ))
+
+
+def _format_source(text):
+    """
+    Shortens a transaction's source text so a full page fits in one message,
+    and escapes it so a stray or cut-off *, _ or ` can't break the page's Markdown.
+    """
+    text = " ".join(text.split())
+    if len(text) > DETAILS_MAX_SOURCE_CHARS:
+        text = text[:DETAILS_MAX_SOURCE_CHARS - 1].rstrip() + "…"
+    return escape_markdown(text, version=1)
+
+
+def _format_page(title, page, rows):
+    """Renders a page of transactions, grouped under their dates."""
+    response = [f"🧾 *Detailed View ({title})*" + (f" — page {page}" if page > 1 else "") + "\n"]
+    if not rows:
+        response.append("_No transactions recorded for this period._")
+
+    current_date = None
+    for row in rows:
+        if row['date'] != current_date:
+            if current_date is not None:
+                response.append("")
+            current_date = row['date']
+            response.append(f"*{current_date}*")
+        label = "🧘 Resisted" if row['type'] == 'resisted' else row['category']
+        # Not in italics: legacy Markdown ignores escapes inside an entity
+        response.append(f"  - {label}: ${row['amount_usd']:,.2f} — {_format_source(row['source_text'])}")
+    return "\n".join(response)
+
+
+async def get_details_page(user_id, timeframe, start_date, end_date, page=1, after=None, before=None):
+    """
+    Fetches and renders one page of a user's transactions.
+
+    Args:
+        user_id: Telegram id of the user
+        timeframe: TIME_RANGES key the range came from, or 'custom'
+        start_date, end_date: Inclusive date range
+        page: Page number shown in the header
+        after, before: Keyset anchor, see db.get_transactions_page
+
+    Returns:
+        Tuple of (Markdown text, InlineKeyboardMarkup or None)
+    """
+    result = await get_transactions_page(user_id, start_date, end_date, after=after, before=before)
+    rows = result['rows']
+    text = _format_page(_title(timeframe, start_date, end_date), page, rows)
+
+    start_day, end_day = to_day(start_date), to_day(end_date)
+    buttons = []
+    if result['has_previous'] and rows:
+        buttons.append(InlineKeyboardButton(
+            "⬅️ Previous", callback_data=_callback_data(timeframe, start_day, end_day, 'p', rows[0], page - 1)))
+    if result['has_next'] and rows:
+        buttons.append(InlineKeyboardButton(
+            "Next ➡️", callback_data=_callback_data(timeframe, start_day, end_day, 'n', rows[-1], page + 1)))
+    return text, InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+async def get_first_details_page(user_id, time_range_str):
+    """Fetches and renders the first page of transactions for a time range string."""
+    start_date, end_date = parse_date_range(time_range_str)
+    timeframe = time_range_str if time_range_str in TIME_RANGES else 'custom'
+    return await get_details_page(user_id, timeframe, start_date.isoformat(), end_date.isoformat())
+
+
+async def details_page_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle a Previous/Next tap on a details page by editing it to show the requested page."""
+    query = update.callback_query
+    await query.answer()
+
+    try:
+        _, timeframe, start_day, end_day, direction, day, type_code, row_id, page = query.data.split(":")
+        key = (int(day), TYPE_CODES[type_code], int(row_id))
+        start_date, end_date = from_day(int(start_day)), from_day(int(end_day))
+        page = int(page)
+    except (ValueError, KeyError):
+        logger.warning(f"Ignoring malformed details page callback: {query.data!r}")
+        return
+
+    text, reply_markup = await get_details_page(
+        update.effective_user.id, timeframe, start_date, end_date, page,
+        after=key if direction == 'n' else None,
+        before=key if direction == 'p' else None,
+    )
+    await query.edit_message_text(text, parse_mode='Markdown', reply_markup=reply_markup)
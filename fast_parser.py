@@ -0,0 +1,267 @@
+"""Local rule-based parser for the most common expense message shapes.
+
+Messages like "coffee 5$", "taxi 12 usd" or "saved 10 on pizza" don't need
+an LLM. This module recognises them and returns the same shape Gemini does,
+so parse_expense_message_async only has to go to the API for everything else.
+"""
+import re
+import logging
+from datetime import date, timedelta
+
+from constants import EXPENSE_CATEGORIES, FAST_PARSE_MIN_CONFIDENCE
+from fx_rates import CURRENCY_ALIASES, BASE_CURRENCY, normalize_currency
+
+logger = logging.getLogger(__name__)
+
+# Keywords that map straight to a category. Plurals are handled by
+# _lookup_category, so only the singular form needs listing.
+CATEGORY_KEYWORDS = {
+    'Food': [
+        'coffee', 'latte', 'cappuccino', 'tea', 'lunch', 'dinner', 'breakfast', 'brunch',
+        'pizza', 'burger', 'sandwich', 'snack', 'meal', 'food', 'grocery', 'groceries',
+        'restaurant', 'cafe', 'bakery', 'bread', 'sushi', 'kebab', 'shawarma', 'dessert',
+        'icecream', 'juice', 'takeaway', 'takeout', 'beer', 'wine',
+    ],
+    'Transport': [
+        'taxi', 'uber', 'cab', 'bus', 'metro', 'subway', 'train', 'tram', 'fuel', 'petrol',
+        'parking', 'flight', 'toll', 'transport',
+    ],
+    'Housing': [
+        'rent', 'mortgage', 'furniture', 'repair', 'housing',
+    ],
+    'Entertainment': [
+        'cinema', 'movie', 'film', 'concert', 'theatre', 'theater', 'netflix', 'spotify',
+        'game', 'bowling', 'museum', 'party', 'club', 'entertainment',
+    ],
+    'Healthcare': [
+        'pharmacy', 'medicine', 'medication', 'pill', 'doctor', 'dentist', 'hospital',
+        'clinic', 'vitamin', 'healthcare',
+    ],
+    'Shopping': [
+        'clothes', 'shirt', 'tshirt', 'jeans', 'jacket', 'shoe', 'sneaker', 'dress',
+        'amazon', 'headphone', 'gadget', 'gift', 'book', 'shopping',
+    ],
+    'Utilities': [
+        'electricity', 'internet', 'wifi', 'utility', 'utilities', 'heating',
+    ],
+}
+
+_KEYWORD_TO_CATEGORY = {
+    keyword: category
+    for category, keywords in CATEGORY_KEYWORDS.items()
+    for keyword in keywords
+    if category in EXPENSE_CATEGORIES
+}
+
+# Phrases that mark money that was not spent
+RESISTED_PATTERN = re.compile(
+    r"\b(saved|save|skipped|skip|resisted|resist|avoided|avoid|passed on|"
+    r"didn'?t buy|did not buy|not buying|instead of buying)\b"
+)
+
+# Words that mark a bare number as an amount of money, e.g. "10 for lunch"
+AMOUNT_CUE_PATTERN = re.compile(r"\b(on|for|spent|spend|paid|pay|cost|costs|saved|save)\b")
+
+# Amount with an explicit currency marker on either side, e.g. "$5", "5$",
+# "5.50 usd", "€12" or "30000 sum". Commas are only accepted as thousands
+# separators, so "5,50" is ambiguous and falls through to Gemini. Currency
+# words must be whole words, so "starbucks" doesn't read as "bucks".
+_NUMBER = r"(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d{1,2})?"
+_CURRENCY = "|".join(
+    re.escape(alias) if not alias.isalpha() else rf"\b{alias}\b"
+    for alias in sorted(CURRENCY_ALIASES, key=len, reverse=True)
+)
+AMOUNT_PATTERN = re.compile(
+    rf"(?:(?P<pre_currency>{_CURRENCY})\s*(?P<pre>{_NUMBER}))|"
+    rf"(?:(?P<post>{_NUMBER})\s*(?P<post_currency>{_CURRENCY}))"
+)
+NUMBER_PATTERN = re.compile(_NUMBER)
+CURRENCY_PATTERN = re.compile(_CURRENCY)
+ISO_DATE_PATTERN = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+
+# Dates we don't resolve locally send the message to Gemini instead
+UNRESOLVED_DATE_PATTERN = re.compile(
+    r"\b(last|next|ago|tomorrow|week|month|monday|tuesday|wednesday|thursday|friday|saturday|sunday|"
+    r"jan|january|feb|february|mar|march|apr|april|may|jun|june|jul|july|aug|august|"
+    r"sep|sept|september|oct|october|nov|november|dec|december)\b"
+)
+
+# Separators between items in a list of expenses. A comma only counts when
+# followed by whitespace so "1,200$" stays one amount.
+SPLIT_PATTERN = re.compile(r",\s+|;|\n")
+
+# Messages longer than this are usually stories, not simple expenses
+MAX_WORDS = 8
+
+_stats = {'hits': 0, 'misses': 0}
+STATS_LOG_EVERY = 100
+
+
+def _parse_amount(text):
+    """Parses a number like '1,200.50' into a float."""
+    return float(text.replace(',', ''))
+
+
+def _lookup_category(word):
+    """Returns the category for a word, trying its singular form as well."""
+    if word in _KEYWORD_TO_CATEGORY:
+        return _KEYWORD_TO_CATEGORY[word]
+    if word.endswith('es') and word[:-2] in _KEYWORD_TO_CATEGORY:
+        return _KEYWORD_TO_CATEGORY[word[:-2]]
+    if word.endswith('s') and word[:-1] in _KEYWORD_TO_CATEGORY:
+        return _KEYWORD_TO_CATEGORY[word[:-1]]
+    return None
+
+
+def _is_bare_amount(text, number):
+    """
+    Tells whether a number without a currency marker reads as an amount of
+    money rather than a quantity ("3 books", "bus 42 to work"): an amount cue
+    has to be present and the number must not come right before a category
+    keyword or a plural noun.
+    """
+    if not AMOUNT_CUE_PATTERN.search(text):
+        return False
+    following = re.search(rf"(?<![\d.,]){re.escape(number)}\s+([a-z']+)", text)
+    if following:
+        word = following.group(1)
+        if _lookup_category(word) or word.endswith('s'):
+            return False
+    return True
+
+
+def _extract_date(text, today):
+    """
+    Resolves the date of a message.
+
+    Returns a date, or None when the message refers to a date that only
+    Gemini can resolve (e.g. 'last friday').
+    """
+    iso_match = ISO_DATE_PATTERN.search(text)
+    if iso_match:
+        try:
+            return date.fromisoformat(iso_match.group(1))
+        except ValueError:
+            return None
+    if UNRESOLVED_DATE_PATTERN.search(text):
+        return None
+    if 'day before yesterday' in text:
+        return today - timedelta(days=2)
+    if 'yesterday' in text:
+        return today - timedelta(days=1)
+    return today
+
+
+def _score(text, today):
+    """
+    Parses a message and scores how confident the result is.
+
+    Returns:
+        Tuple of (transaction dict or None, confidence between 0 and 1)
+    """
+    transaction_date = _extract_date(text, today)
+    if transaction_date is None:
+        return None, 0.0
+
+    # Drop the ISO date so its digits aren't mistaken for an amount
+    text = ISO_DATE_PATTERN.sub(' ', text)
+
+    confidence = 1.0
+    numbers = NUMBER_PATTERN.findall(text)
+    if len(numbers) != 1:
+        return None, 0.0
+
+    # Two currencies in one part ("5 usd, about 4€") are for Gemini to sort out
+    if len(CURRENCY_PATTERN.findall(text)) > 1:
+        return None, 0.0
+
+    amount_match = AMOUNT_PATTERN.search(text)
+    if amount_match:
+        amount = _parse_amount(amount_match.group('pre') or amount_match.group('post'))
+        currency = normalize_currency(amount_match.group('pre_currency') or amount_match.group('post_currency'))
+    else:
+        # A bare number may be a count of things; it's only taken as dollars,
+        # and then less surely, when the wording says it's money
+        if not _is_bare_amount(text, numbers[0]):
+            return None, 0.0
+        amount = _parse_amount(numbers[0])
+        currency = BASE_CURRENCY
+        confidence -= 0.2
+    if amount <= 0:
+        return None, 0.0
+
+    words = re.findall(r"[a-z']+", text)
+    categories = {_lookup_category(word) for word in words} - {None}
+    if len(categories) != 1:
+        return None, 0.0
+
+    if len(words) > MAX_WORDS:
+        confidence -= 0.1 * (len(words) - MAX_WORDS)
+
+    transaction = {
+        'type': 'resisted' if RESISTED_PATTERN.search(text) else 'expense',
+        'amount': round(amount, 2),
+        'currency': currency,
+        'category': categories.pop(),
+        'date': transaction_date.isoformat(),
+    }
+    return transaction, max(confidence, 0.0)
+
+
+def parse_locally(message_text, today=None):
+    """
+    Tries to parse a message without calling Gemini.
+
+    Lists like "coffee 4$, bus 2$, skipped cinema 12$" are split into parts,
+    and every part has to parse confidently on its own.
+
+    Args:
+        message_text: Raw message from the user
+        today: Date to resolve relative dates against (defaults to today)
+
+    Returns:
+        List of transaction dicts in the same shape Gemini returns (amount in
+        the original currency), or None
+        when the local parser isn't confident enough and Gemini should be asked.
+    """
+    today = today or date.today()
+    parts = [part.strip() for part in SPLIT_PATTERN.split(message_text.strip().lower())]
+
+    transactions = []
+    for part in filter(None, parts):
+        transaction, confidence = _score(part, today)
+        if transaction is None or confidence < FAST_PARSE_MIN_CONFIDENCE:
+            transactions = None
+            break
+        transactions.append(transaction)
+
+    if transactions:
+        _stats['hits'] += 1
+    else:
+        transactions = None
+        _stats['misses'] += 1
+
+    total = _stats['hits'] + _stats['misses']
+    if total % STATS_LOG_EVERY == 0:
+        stats = get_fast_path_stats()
+        logger.info(f"Fast-path parser: {stats['hits']}/{stats['total']} messages parsed locally "
+                    f"({stats['hit_rate']:.1%} of Gemini calls saved)")
+
+    return transactions
+
+
+def get_fast_path_stats():
+    """Returns hit/miss counters for the local parser."""
+    total = _stats['hits'] + _stats['misses']
+    return {
+        'hits': _stats['hits'],
+        'misses': _stats['misses'],
+        'total': total,
+        'hit_rate': _stats['hits'] / total if total else 0.0,
+    }
+
+
+def reset_fast_path_stats():
+    """Resets the hit/miss counters."""
+    _stats['hits'] = 0
+    _stats['misses'] = 0
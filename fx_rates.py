@@ -0,0 +1,136 @@
+"""Local exchange-rate table used to convert parsed amounts to USD.
+
+Gemini returns the amount and currency exactly as the user wrote them and
+the conversion happens here, from daily rates stored in the fx_rates table.
+Rates are loaded from a CSV file (see FX_RATES_FILE) with the columns
+date,currency,usd_per_unit, e.g. "2025-07-01,EUR,1.17". The repository ships
+one with a rate for every currency in CURRENCY_ALIASES; append newer rows to
+keep conversions current. Currencies with no rate at all are converted by
+Gemini instead (see gemini_parser), and that rate is remembered here.
+
+Run `python fx_rates.py [path]` to load a file by hand.
+"""
+import os
+import csv
+import sys
+import logging
+import threading
+from datetime import date
+
+from constants import FX_RATES_FILE
+from db import read_connection, write_connection
+
+logger = logging.getLogger(__name__)
+
+BASE_CURRENCY = 'USD'
+
+# Symbols and words users type, mapped to ISO 4217 codes
+CURRENCY_ALIASES = {
+    '$': 'USD', 'usd': 'USD', 'dollar': 'USD', 'dollars': 'USD', 'bucks': 'USD',
+    '€': 'EUR', 'eur': 'EUR', 'euro': 'EUR', 'euros': 'EUR',
+    '£': 'GBP', 'gbp': 'GBP', 'pound': 'GBP', 'pounds': 'GBP',
+    '₽': 'RUB', 'rub': 'RUB', 'ruble': 'RUB', 'rubles': 'RUB',
+    'uzs': 'UZS', 'sum': 'UZS', 'som': 'UZS', 'soum': 'UZS',
+    '₸': 'KZT', 'kzt': 'KZT', 'tenge': 'KZT',
+    '₺': 'TRY', 'lira': 'TRY',
+    '¥': 'JPY', 'jpy': 'JPY', 'yen': 'JPY',
+    'cny': 'CNY', 'yuan': 'CNY',
+    '₹': 'INR', 'inr': 'INR', 'rupee': 'INR', 'rupees': 'INR',
+    '₩': 'KRW', 'krw': 'KRW',
+}
+
+# (currency, date) -> USD per unit, filled on lookup and cleared on refresh
+_rate_cache = {}
+_rate_cache_lock = threading.Lock()
+
+
+def normalize_currency(currency):
+    """Maps a symbol, word or code to an ISO 4217 code (defaults to USD)."""
+    if not currency:
+        return BASE_CURRENCY
+    currency = str(currency).strip()
+    return CURRENCY_ALIASES.get(currency.lower(), currency.upper())
+
+
+def refresh_rates_from_file(path=FX_RATES_FILE):
+    """
+    Loads rates from a CSV file into the fx_rates table.
+
+    Existing rates for the same currency and date are replaced.
+    Returns: number of rates loaded.
+    """
+    if not os.path.exists(path):
+        logger.warning(f"FX rates file '{path}' not found; only USD amounts can be converted")
+        return 0
+
+    with open(path, newline='') as f:
+        rows = [
+            (date.fromisoformat(row['date'].strip()).isoformat(),
+             normalize_currency(row['currency']),
+             float(row['usd_per_unit']))
+            for row in csv.DictReader(f)
+        ]
+
+    with write_connection() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO fx_rates (date, currency, usd_per_unit) VALUES (?, ?, ?)", rows
+        )
+
+    with _rate_cache_lock:
+        _rate_cache.clear()
+    logger.info(f"Loaded {len(rows)} FX rates from '{path}'")
+    return len(rows)
+
+
+def get_rate(currency, on_date):
+    """
+    Returns how many USD one unit of a currency was worth on a date.
+
+    Uses the latest rate on or before the date, or the earliest known rate
+    for dates before the table starts. Returns None for unknown currencies.
+    """
+    currency = normalize_currency(currency)
+    if currency == BASE_CURRENCY:
+        return 1.0
+
+    key = (currency, on_date)
+    with _rate_cache_lock:
+        if key in _rate_cache:
+            return _rate_cache[key]
+
+    with read_connection() as conn:
+        row = conn.execute(
+            "SELECT usd_per_unit FROM fx_rates WHERE currency = ? AND date <= ? ORDER BY date DESC LIMIT 1",
+            (currency, on_date)
+        ).fetchone()
+        if row is None:
+            row = conn.execute(
+                "SELECT usd_per_unit FROM fx_rates WHERE currency = ? ORDER BY date LIMIT 1",
+                (currency,)
+            ).fetchone()
+
+    rate = row['usd_per_unit'] if row else None
+    with _rate_cache_lock:
+        _rate_cache[key] = rate
+    return rate
+
+
+def remember_rate(currency, on_date, usd_per_unit):
+    """Caches a rate learned elsewhere (e.g. from Gemini) for lookups until the next refresh."""
+    with _rate_cache_lock:
+        _rate_cache[(normalize_currency(currency), on_date)] = usd_per_unit
+
+
+def convert_to_usd(amount, currency, on_date):
+    """Converts an amount to USD at the rate for on_date (YYYY-MM-DD), or None if unknown."""
+    rate = get_rate(currency, on_date)
+    if rate is None:
+        return None
+    return round(float(amount) * rate, 2)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    from db import init_db
+    init_db()
+    refresh_rates_from_file(sys.argv[1] if len(sys.argv) > 1 else FX_RATES_FILE)
@@ -1,77 +1,494 @@
 import os
-from google import genai
-from google.genai import types
-from constants import EXPENSE_CATEGORIES
-from datetime import datetime
+import json
+import logging
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from constants import (
+    EXPENSE_CATEGORIES, GEMINI_API_KEY, GEMINI_MAX_CONCURRENCY, GEMINI_TIMEOUT_MS,
+    GEMINI_BATCH_WINDOW_MS, GEMINI_BATCH_MAX_SIZE
+)
+from batching import LazySemaphore, MicroBatcher
+from fast_parser import parse_locally
+from parse_cache import get_cached_parse, cache_parse
+from db_async import run_db
+from fx_rates import convert_to_usd, normalize_currency, remember_rate
+from utils import clean_json_response
 
-def parse_expense_message(message_text):
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = "gemini-2.5-flash"
+
+TRANSACTION_TYPES = ('expense', 'resisted')
+
+# Keys every successfully parsed transaction must have
+RESULT_KEYS = ('type', 'amount', 'category', 'date')
+
+# Everything that doesn't change between messages lives in the system
+# instruction, so each request only carries the message and today's date.
+SYSTEM_INSTRUCTION = f"""You are an API backend for an expense tracker.
+Each request gives today's date and one or more user messages about expenses or
+resisted spending (money the user decided not to spend).
+
+For every expense or resisted purchase mentioned in a message, extract:
+- type: "expense" if money was spent, "resisted" if not spent
+- amount: the amount exactly as written, as a number (do not convert it)
+- currency: ISO 4217 code of the currency used (USD if none is given)
+- category: one of [{", ".join(EXPENSE_CATEGORIES)}]
+- date: YYYY-MM-DD, relative to today's date (today if not mentioned)
+
+If a message lacks an amount or isn't about spending, return no transactions
+for it and set error to "not-enough-data" with a short explanation.
+Never explain your answer, never include commentary."""
+
+# google-genai takes a while to import and most messages never reach Gemini
+# (fast path, parse cache), so it's loaded on first use, see _import_genai()
+genai = None
+types = None
+
+# Bounds concurrent Gemini requests
+_parse_semaphore = LazySemaphore(GEMINI_MAX_CONCURRENCY)
+
+# Shared client and config, see get_client()
+_client = None
+_client_lock = threading.Lock()
+_generate_content_config = None
+_batch_config = None
+_conversion_config = None
+
+
+@dataclass
+class ParsedTransaction:
+    """A single transaction extracted from a user message."""
+    type: str
+    amount: float
+    currency: str
+    category: str
+    date: str
+    amount_usd: float = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Validates a parsed dict. Raises ValueError if it can't be used."""
+        if data.get('type') not in TRANSACTION_TYPES:
+            raise ValueError(f"Unknown transaction type: {data.get('type')!r}")
+        try:
+            amount = float(data['amount'] if 'amount' in data else data['amount_usd'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Invalid amount: {data.get('amount')!r}")
+        if amount <= 0:
+            raise ValueError(f"Amount must be positive: {amount}")
+        try:
+            transaction_date = date.fromisoformat(str(data['date'])).isoformat()
+        except (KeyError, ValueError):
+            raise ValueError(f"Invalid date: {data.get('date')!r}")
+        category = data.get('category')
+        if category not in EXPENSE_CATEGORIES:
+            category = 'Other'
+        # Entries cached before local conversion only carry amount_usd
+        currency = 'USD' if 'amount' not in data else normalize_currency(data.get('currency'))
+        return cls(data['type'], amount, currency, category, transaction_date)
+
+    def to_dict(self):
+        """Returns the transaction in the shape db.add_transactions expects."""
+        return {
+            'type': self.type,
+            'amount': self.amount,
+            'currency': self.currency,
+            'category': self.category,
+            'date': self.date,
+            'amount_usd': self.amount_usd,
+        }
+
+
+@dataclass
+class ParseResult:
+    """Outcome of parsing a message: transactions, or an error and why."""
+    transactions: list = field(default_factory=list)
+    error: str = None
+    explanation: str = None
+
+
+def _transaction_schema():
+    """Response schema for one transaction."""
+    return types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            'type': types.Schema(type=types.Type.STRING, enum=list(TRANSACTION_TYPES)),
+            'amount': types.Schema(type=types.Type.NUMBER),
+            'currency': types.Schema(type=types.Type.STRING),
+            'category': types.Schema(type=types.Type.STRING, enum=list(EXPENSE_CATEGORIES)),
+            'date': types.Schema(type=types.Type.STRING),
+        },
+        required=['type', 'amount', 'currency', 'category', 'date'],
+    )
+
+
+def _message_result_schema():
+    """Response schema for the result of one message."""
+    return types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            'transactions': types.Schema(type=types.Type.ARRAY, items=_transaction_schema()),
+            'error': types.Schema(type=types.Type.STRING, nullable=True),
+            'explanation': types.Schema(type=types.Type.STRING, nullable=True),
+        },
+        required=['transactions'],
+    )
+
+
+def _import_genai():
+    """Imports google-genai into the module globals on first use."""
+    global genai, types
+    if types is None:
+        from google import genai as genai_module
+        from google.genai import types as types_module
+        genai, types = genai_module, types_module
+
+
+def get_client():
     """
-    Send a prompt to Gemini to extract structured spending data from user input.
-    Returns: JSON string from Gemini (the main bot will parse it).
+    Returns the shared Gemini client, creating it on first use.
+
+    The client is reused for every request so its underlying HTTP connections
+    stay alive instead of doing a new TLS handshake per message.
     """
-    today = datetime.now().strftime('%Y-%m-%d')
-    categories_str = ", ".join(EXPENSE_CATEGORIES)
+    global _client
+    _import_genai()
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = genai.Client(
+                    api_key=GEMINI_API_KEY,
+                    http_options=types.HttpOptions(timeout=GEMINI_TIMEOUT_MS),
+                )
+    return _client
 
-    prompt = f"""
-Parse this user message about an expense or resisted spending.
 
-User message: "{message_text}"
+def reset_client():
+    """Drops the shared client so the next request builds a fresh one."""
+    global _client
+    with _client_lock:
+        _client = None
 
-Extract:
-- type: "expense" if money was spent, "resisted" if not spent
-- amount_usd: amount in USD (convert if needed)
-- category: one of [{categories_str}]
-- date: YYYY-MM-DD (default to today: {today})
-
-If info is missing, respond with:
-{{
-  "error": "not-enough-data",
-  "explanation": "..."
-}}
-
-Otherwise, respond with only this JSON (no commentary):
-{{
-  "type": ...,
-  "amount_usd": ...,
-  "category": ...,
-  "date": ...
-}}
-"""
-    try:
-        client = genai.Client(
-                api_key=GEMINI_API_KEY,
+
+def _make_config(response_schema):
+    """Builds a JSON-mode generation config with the given response schema."""
+    # No search tool: currencies are converted locally by fx_rates, see _convert_with_gemini()
+    return types.GenerateContentConfig(
+        thinking_config=types.ThinkingConfig(
+            thinking_budget=0,
+        ),
+        response_mime_type="application/json",
+        response_schema=response_schema,
+        system_instruction=[
+            types.Part.from_text(text=SYSTEM_INSTRUCTION),
+        ],
+    )
+
+
+def _get_generate_content_config():
+    """Returns the generation config, which is the same for every message."""
+    global _generate_content_config
+    _import_genai()
+    if _generate_content_config is None:
+        _generate_content_config = _make_config(_message_result_schema())
+    return _generate_content_config
+
+
+def _get_batch_config():
+    """Returns the generation config for batched requests."""
+    global _batch_config
+    _import_genai()
+    if _batch_config is None:
+        _batch_config = _make_config(
+            types.Schema(type=types.Type.ARRAY, items=_message_result_schema())
         )
+    return _batch_config
 
-        model = "gemini-2.5-flash"
-        contents = [
-            types.Content(
-                role="user",
-                parts=[
-                    types.Part.from_text(text=prompt),
-                ],
-            ),
-        ]
-        tools = [
-            types.Tool(googleSearch=types.GoogleSearch()),
-        ]
-        generate_content_config = types.GenerateContentConfig(
+
+def _get_conversion_config():
+    """
+    Returns the config for currency conversions: Google Search on, and so no
+    response schema (the API doesn't take both); the prompt asks for JSON.
+    """
+    global _conversion_config
+    _import_genai()
+    if _conversion_config is None:
+        _conversion_config = types.GenerateContentConfig(
             thinking_config=types.ThinkingConfig(
                 thinking_budget=0,
             ),
-            tools=tools,
-            system_instruction=[
-                types.Part.from_text(text="You are an API backend for an expense tracker. Only output a single valid JSON object as specified. Never explain your answer, never include commentary."),
-            ],
+            tools=[types.Tool(google_search=types.GoogleSearch())],
         )
+    return _conversion_config
+
+
+def _to_contents(prompt):
+    """Wraps a prompt as user contents."""
+    _import_genai()
+    return [
+        types.Content(
+            role="user",
+            parts=[
+                types.Part.from_text(text=prompt),
+            ],
+        ),
+    ]
+
+
+def _build_contents(message_text):
+    """Builds the prompt contents for a message."""
+    today = datetime.now().strftime('%Y-%m-%d')
+    return _to_contents(f'Today: {today}\nMessage: "{message_text}"')
+
+
+def _build_batch_contents(message_texts):
+    """Builds the prompt contents for several messages answered in one call."""
+    today = datetime.now().strftime('%Y-%m-%d')
+    numbered_messages = "\n".join(f'{i}. "{text}"' for i, text in enumerate(message_texts, 1))
+    return _to_contents(
+        f"Today: {today}\n"
+        f"Return one result per message, in order ({len(message_texts)} in total).\n"
+        f"Messages:\n{numbered_messages}"
+    )
 
+
+def _api_error(e):
+    """Formats an API exception in the parser's error JSON shape."""
+    return json.dumps({"error": "api-error", "explanation": f"Gemini error: {str(e)}"})
+
+
+def _normalize_item(item):
+    """
+    Turns one message's result from Gemini into the cached JSON shape.
+
+    Returns a JSON array of transactions or an error object, or None if the
+    item is malformed.
+    """
+    if isinstance(item, dict) and item.get("error"):
+        return json.dumps({"error": item["error"], "explanation": item.get("explanation") or ""})
+    if isinstance(item, dict) and item.get('transactions') == []:
+        return json.dumps({"error": "not-enough-data",
+                           "explanation": item.get("explanation") or "I couldn't find an amount in that message."})
+    if isinstance(item, dict):
+        item = item.get('transactions', [item])
+    if not isinstance(item, list) or not item:
+        return None
+    if not all(isinstance(transaction, dict) and all(key in transaction for key in RESULT_KEYS)
+               for transaction in item):
+        return None
+    return json.dumps(item)
+
+
+def _normalize_response(response):
+    """Normalizes a single-message response, treating malformed ones as errors."""
+    try:
+        result = _normalize_item(json.loads(response))
+    except json.JSONDecodeError:
+        result = None
+    if result is None:
+        logger.error(f"Invalid response from Gemini: {response}")
+        return json.dumps({"error": "invalid-response",
+                           "explanation": "The parser returned data I couldn't read."})
+    return result
+
+
+def _to_parse_result(result_json):
+    """
+    Validates a parse result and converts its amounts to USD.
+
+    Conversion uses the local FX table. Transactions in a currency without
+    a known rate keep amount_usd None, for _convert_with_gemini() to fill in.
+    """
+    try:
+        data = json.loads(result_json)
+    except (TypeError, ValueError):
+        return ParseResult(error="invalid-response", explanation="The parser returned data I couldn't read.")
+    if isinstance(data, dict) and "error" in data:
+        return ParseResult(error=data["error"], explanation=data.get("explanation") or "Unknown error")
+
+    transactions = []
+    for item in (data if isinstance(data, list) else [data]):
+        try:
+            transaction = ParsedTransaction.from_dict(item)
+        except (AttributeError, ValueError) as e:
+            logger.warning(f"Rejected parsed transaction {item!r}: {e}")
+            return ParseResult(error="invalid-response", explanation="The parser returned data I couldn't read.")
+        transaction.amount_usd = convert_to_usd(transaction.amount, transaction.currency, transaction.date)
+        transactions.append(transaction)
+    return ParseResult(transactions=transactions)
+
+
+def _unknown_currency(transaction):
+    """The error returned when a transaction's currency can't be converted."""
+    return ParseResult(error="unknown-currency",
+                       explanation=f"No exchange rate available for {transaction.currency}.")
+
+
+async def _generate_async(contents, config):
+    """Streams a Gemini response and returns its cleaned text."""
+    async with _parse_semaphore.get():
         response = ""
-        for chunk in client.models.generate_content_stream(
-            model=model,
+        async for chunk in await get_client().aio.models.generate_content_stream(
+            model=GEMINI_MODEL,
             contents=contents,
-            config=generate_content_config,
+            config=config,
         ):
             if hasattr(chunk, "text") and chunk.text:
                 response += chunk.text
-        return response.strip()
+        return clean_json_response(response)
+
+
+async def _parse_single_async(message_text):
+    """Parses one message with its own Gemini call."""
+    try:
+        response = await _generate_async(_build_contents(message_text), _get_generate_content_config())
+    except Exception as e:
+        # The client may be holding a broken connection; start over next time
+        reset_client()
+        return _api_error(e)
+    response = _normalize_response(response)
+    await run_db(cache_parse, message_text, response)
+    return response
+
+
+def _parse_conversion(response):
+    """Reads the amount from a conversion reply, or None unless it is exactly {"amount_usd": <number>}."""
+    try:
+        data = json.loads(response)
+    except (TypeError, ValueError):
+        return None
+    amount_usd = data.get('amount_usd') if isinstance(data, dict) and len(data) == 1 else None
+    if isinstance(amount_usd, bool) or not isinstance(amount_usd, (int, float)) or amount_usd <= 0:
+        return None
+    return float(amount_usd)
+
+
+async def _convert_with_gemini(transaction):
+    """
+    Asks Gemini, with Google Search, what a transaction's amount was worth in
+    USD on its date, for currencies missing from the local FX table.
+    Returns: the USD amount, or None if Gemini couldn't give one.
+    """
+    prompt = (f"Convert {transaction.amount} {transaction.currency} to USD at the exchange rate "
+              f'on {transaction.date}. Reply with only a JSON object like {{"amount_usd": 12.34}}.')
+    try:
+        response = await _generate_async(_to_contents(prompt), _get_conversion_config())
     except Exception as e:
-        return f'''{{"error": "api-error", "explanation": "Gemini error: {str(e)}"}}'''
+        logger.warning(f"Gemini conversion of {transaction.currency} failed: {e}")
+        return None
+    amount_usd = _parse_conversion(response)
+    if not amount_usd:
+        logger.warning(f"Gemini gave no USD amount for {transaction.amount} {transaction.currency}: {response!r}")
+        return None
+    remember_rate(transaction.currency, transaction.date, amount_usd / transaction.amount)
+    return round(amount_usd, 2)
+
+
+async def _run_batch(batch):
+    """
+    Parses a batch of (message_text, future) pairs with one Gemini call.
+
+    Elements that come back malformed, or a reply that isn't an array of the
+    right length, fall back to one call per affected message.
+    """
+    try:
+        if len(batch) == 1:
+            message_text, future = batch[0]
+            result = await _parse_single_async(message_text)
+            if not future.done():
+                future.set_result(result)
+            return
+
+        message_texts = [message_text for message_text, _ in batch]
+        try:
+            response = await _generate_async(_build_batch_contents(message_texts), _get_batch_config())
+        except Exception as e:
+            reset_client()
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(_api_error(e))
+            return
+
+        try:
+            items = json.loads(response)
+        except json.JSONDecodeError:
+            items = None
+        if not isinstance(items, list) or len(items) != len(batch):
+            logger.warning(f"Malformed batch response for {len(batch)} messages, falling back to single calls")
+            items = [None] * len(batch)
+
+        fallbacks = []
+        for (message_text, future), item in zip(batch, items):
+            result = _normalize_item(item)
+            if result is not None:
+                await run_db(cache_parse, message_text, result)
+                if not future.done():
+                    future.set_result(result)
+            else:
+                fallbacks.append((message_text, future))
+
+        if fallbacks:
+            results = await asyncio.gather(*(_parse_single_async(text) for text, _ in fallbacks))
+            for (_, future), result in zip(fallbacks, results):
+                if not future.done():
+                    future.set_result(result)
+    except Exception as e:
+        logger.error(f"Batch parse failed: {e}", exc_info=True)
+        for _, future in batch:
+            if not future.done():
+                future.set_result(_api_error(e))
+
+
+# Messages waiting to be sent to Gemini as one batch; each future resolves
+# to the message's JSON result string
+_parse_batcher = MicroBatcher(_run_batch, GEMINI_BATCH_WINDOW_MS, GEMINI_BATCH_MAX_SIZE)
+
+
+def warm_up():
+    """Imports google-genai and builds the client and configs ahead of the first message."""
+    try:
+        get_client()
+        _get_generate_content_config()
+        _get_batch_config()
+    except Exception as e:
+        # Not fatal: the first message retries all of this
+        logger.warning(f"Gemini warm-up failed: {e}")
+
+
+async def parse_expense_message_async(message_text):
+    """
+    Extracts structured spending data from a user message.
+
+    Uses the native async Gemini client so the event loop keeps serving other
+    updates while a request is in flight. Messages arriving close together
+    are sent to Gemini as one batched request, and at most
+    GEMINI_MAX_CONCURRENCY requests run at once.
+    Returns: ParseResult with validated transactions (amount_usd filled in)
+    or an error.
+    """
+    # Validation looks up FX rates, which may hit the database
+    result = await run_db(_to_parse_result, await _parse_message_async(message_text))
+    for transaction in result.transactions:
+        if transaction.amount_usd is None:
+            transaction.amount_usd = await _convert_with_gemini(transaction)
+            if transaction.amount_usd is None:
+                return _unknown_currency(transaction)
+    return result
+
+
+async def _parse_message_async(message_text):
+    """Parses a message into a JSON array of transactions or an error object."""
+    # Common shapes like "coffee 5$" are handled without an API call
+    local_result = parse_locally(message_text)
+    if local_result is not None:
+        return json.dumps(local_result)
+
+    # Repeated messages are answered from the parse cache
+    cached_result = await run_db(get_cached_parse, message_text)
+    if cached_result is not None:
+        return cached_result
+
+    return await _parse_batcher.submit(message_text)
@@ -1,14 +1,15 @@
 """Command and message handlers for the expense tracker bot"""
 import logging
-import json
 from telegram import Update
 from telegram.ext import ContextTypes
 
 from constants import TIME_RANGES
-from db import add_transaction, get_transactions_summary, get_transactions_details
-from gemini_parser import parse_expense_message
-from chart_generator import generate_pie_chart
-from utils import safe_reply, clean_json_response
+from db_async import add_transactions, get_transactions_summary
+from gemini_parser import parse_expense_message_async
+from chart_service import ChartRenderError
+from chart_cache import get_chart, invalidate as invalidate_charts
+from details_pages import get_first_details_page
+from utils import safe_reply
 
 logger = logging.getLogger(__name__)
 
@@ -31,10 +32,13 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def summary_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Sends a summary of transactions."""
-    user_id = update.effective_user.id if update.effective_user else "Unknown"
+    if not update.effective_user:
+        logger.warning("Received command with no sender")
+        return
+    user_id = update.effective_user.id
     time_range_str = ' '.join(context.args) if context.args else 'today'
     logger.info(f"Received /summary command for range '{time_range_str}' from user {user_id}")
-    summary = get_transactions_summary(time_range_str)
+    summary = await get_transactions_summary(user_id, time_range_str)
 
     title = TIME_RANGES.get(time_range_str, time_range_str.replace("_", " ").title())
     response = [f"🧾 *Summary ({title})*\n"]
@@ -49,33 +53,22 @@ async def summary_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await safe_reply(update, "\n".join(response), parse_mode='Markdown')
 
 async def details_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Sends a detailed list of transactions."""
-    user_id = update.effective_user.id if update.effective_user else "Unknown"
+    """Sends the first page of a detailed list of transactions."""
+    if not update.effective_user:
+        logger.warning("Received command with no sender")
+        return
+    user_id = update.effective_user.id
     time_range_str = ' '.join(context.args) if context.args else 'today'
     logger.info(f"Received /details command for range '{time_range_str}' from user {user_id}")
-    details = get_transactions_details(time_range_str)
-
-    title = TIME_RANGES.get(time_range_str, time_range_str.replace("_", " ").title())
-    response = [f"🧾 *Detailed View ({title})*\n"]
-
-    if details['expenses_by_category']:
-        for category, items in sorted(details['expenses_by_category'].items()):
-            response.append(f"*{category}*")
-            for item in items:
-                response.append(f"  - ${item['amount_usd']:,.2f} — _{item['source_text']}_")
-    else:
-        response.append("_No expenses recorded for this period._")
-
-    if details['resisted']:
-        response.append("\n*Resisted*")
-        for item in details['resisted']:
-            response.append(f"  - ${item['amount_usd']:,.2f} — _{item['source_text']}_")
-
-    await safe_reply(update, "\n".join(response), parse_mode='Markdown')
+    text, reply_markup = await get_first_details_page(user_id, time_range_str)
+    await safe_reply(update, text, parse_mode='Markdown', reply_markup=reply_markup)
 
 async def chart_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Generates and sends a pie chart of transactions."""
-    user_id = update.effective_user.id if update.effective_user else "Unknown"
+    if not update.effective_user:
+        logger.warning("Received command with no sender")
+        return
+    user_id = update.effective_user.id
     time_range_str = ' '.join(context.args) if context.args else 'today'
     logger.info(f"Received /chart command for range '{time_range_str}' from user {user_id}")
 
@@ -84,14 +77,19 @@ async def chart_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message:
         thinking_message = await update.message.reply_text("Generating chart...")
 
-    summary = get_transactions_summary(time_range_str)
+    summary = await get_transactions_summary(user_id, time_range_str)
     title = TIME_RANGES.get(time_range_str, time_range_str.replace("_", " ").title())
-    chart_buffer = generate_pie_chart(summary, title)
+    try:
+        chart = await get_chart('pie', summary, title, user_id=user_id, time_range_str=time_range_str)
+    except ChartRenderError as e:
+        logger.warning(f"Chart for user {user_id} failed: {e}")
+        await safe_reply(update, "⏳ Charts are busy right now, please try again in a moment.")
+        return
 
-    if chart_buffer:
+    if chart:
         # Send the chart
         if update.message:
-            await update.message.reply_photo(photo=chart_buffer)
+            chart.remember_upload(await update.message.reply_photo(photo=chart.photo))
             # Delete the thinking message if it exists
             if thinking_message:
                 try:
@@ -102,47 +100,63 @@ async def chart_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.callback_query.answer()
             # For callbacks, we can't easily send photos in the same chat, so just notify
             await update.callback_query.edit_message_text("Chart generated! Check the latest messages.")
-            await update.effective_chat.send_photo(photo=chart_buffer)
+            chart.remember_upload(await update.effective_chat.send_photo(photo=chart.photo))
     else:
         await safe_reply(update, "No data to display in a chart for this period.")
 
+def format_recorded_reply(transactions):
+    """Builds the confirmation message for newly recorded transactions."""
+    if len(transactions) == 1:
+        transaction = transactions[0]
+        if transaction.type == 'expense':
+            return f"✅ Expense recorded: ${transaction.amount_usd:,.2f} for {transaction.category}."
+        return f"✅ Resisted spending recorded: Saved ${transaction.amount_usd:,.2f} from {transaction.category}."
+
+    lines = [f"✅ Recorded {len(transactions)} transactions:"]
+    for transaction in transactions:
+        if transaction.type == 'expense':
+            lines.append(f"  - 💸 ${transaction.amount_usd:,.2f} for {transaction.category}")
+        else:
+            lines.append(f"  - 🧘 Saved ${transaction.amount_usd:,.2f} from {transaction.category}")
+
+    total_expenses = sum(t.amount_usd for t in transactions if t.type == 'expense')
+    total_resisted = sum(t.amount_usd for t in transactions if t.type == 'resisted')
+    if total_expenses:
+        lines.append(f"\nSpent: ${total_expenses:,.2f}")
+    if total_resisted:
+        lines.append(f"Resisted: ${total_resisted:,.2f}")
+    return "\n".join(lines)
+
 async def process_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Processes natural language messages for expenses or resisted spending."""
     # Ensure we have a message to process
     if not update.message or not update.message.text:
         logger.warning("Received update with no message text")
         return
+    # Transactions belong to a user, so anonymous posts (e.g. channels) can't be recorded
+    if not update.effective_user:
+        logger.warning("Received message with no sender")
+        return
 
     message_text = update.message.text
-    user_id = update.effective_user.id if update.effective_user else "Unknown"
+    user_id = update.effective_user.id
     logger.info(f"Processing message '{message_text}' from user {user_id}")
 
     thinking_message = await update.message.reply_text("🧠 Thinking...")
 
-    gemini_response_str = parse_expense_message(message_text)
-
     try:
-        # Clean the response
-        cleaned_str = clean_json_response(gemini_response_str)
+        result = await parse_expense_message_async(message_text)
 
-        data = json.loads(cleaned_str)
-
-        if "error" in data:
-            await thinking_message.edit_text(f"😕 Error from parser: {data.get('explanation', 'Unknown error')}")
+        if result.error:
+            await thinking_message.edit_text(f"😕 Error from parser: {result.explanation or 'Unknown error'}")
             return
 
-        add_transaction(data, message_text)
-
-        if data['type'] == 'expense':
-            reply = f"✅ Expense recorded: ${data['amount_usd']:,.2f} for {data['category']}."
-        else:
-            reply = f"✅ Resisted spending recorded: Saved ${data['amount_usd']:,.2f} from {data['category']}."
+        await add_transactions(user_id, [transaction.to_dict() for transaction in result.transactions], message_text)
+        # Charts covering these dates no longer match the data
+        invalidate_charts(user_id, [transaction.date for transaction in result.transactions])
 
-        await thinking_message.edit_text(reply)
+        await thinking_message.edit_text(format_recorded_reply(result.transactions))
 
-    except json.JSONDecodeError:
-        logger.error(f"Failed to decode JSON from Gemini: {gemini_response_str}")
-        await thinking_message.edit_text("Sorry, I couldn't understand that. The response from the parser was invalid.")
     except Exception as e:
         logger.error(f"An error occurred in process_message: {e}", exc_info=True)
         await thinking_message.edit_text("An unexpected error occurred while processing your message.")
\ No newline at end of file
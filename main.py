@@ -1,9 +1,15 @@
 """Main entry point for the expense tracker bot."""
+import sys
+import asyncio
 import logging
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
 
-from constants import BOT_TOKEN
+from constants import BOT_TOKEN, CUMULATIVE_SYNC_INTERVAL_SECONDS
 from db import init_db
+from db_async import sync_cumulative_totals, shutdown as shutdown_db
+from chart_service import warm_up as warm_up_chart_workers, shutdown as shutdown_chart_workers
+from gemini_parser import warm_up as warm_up_gemini
+from fx_rates import refresh_rates_from_file
 from handlers import (
     start_command, chart_command, process_message
 )
@@ -11,16 +17,46 @@ from conversations import (
     piechart_conv_handler, barchart_conv_handler,
     summary_conv_handler, details_conv_handler
 )
+from details_pages import CALLBACK_PREFIX as DETAILS_PAGE_PREFIX, details_page_selected
 
 # Enable logging
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Long-running tasks started in post_init and cancelled in post_shutdown
+_background_tasks = []
+
+async def sync_cumulative_totals_periodically():
+    """Keeps the running totals used by summaries in sync with late-dated inserts."""
+    while True:
+        await asyncio.sleep(CUMULATIVE_SYNC_INTERVAL_SECONDS)
+        try:
+            await sync_cumulative_totals()
+        except Exception as e:
+            logger.error(f"Failed to sync cumulative totals: {e}", exc_info=True)
+
+async def post_init(application: Application):
+    """Starts background jobs once the event loop is running."""
+    _background_tasks.append(application.create_task(sync_cumulative_totals_periodically()))
+    # Start the chart worker processes now rather than on the first /piechart
+    _background_tasks.append(application.create_task(warm_up_chart_workers()))
+    # google-genai is imported lazily; load it off the event loop while polling starts
+    _background_tasks.append(application.create_task(asyncio.to_thread(warm_up_gemini)))
+
+async def post_shutdown(application: Application):
+    """Stops background tasks and the chart and database workers once the bot has stopped."""
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    shutdown_chart_workers()
+    await shutdown_db()
+
 def main():
     """Start the bot."""
     init_db()
+    refresh_rates_from_file()
 
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = Application.builder().token(BOT_TOKEN).post_init(post_init).post_shutdown(post_shutdown).build()
 
     # Register command handlers
     application.add_handler(CommandHandler("start", start_command))
@@ -31,12 +67,22 @@ def main():
     application.add_handler(barchart_conv_handler)
     application.add_handler(summary_conv_handler)  # New interactive summary
     application.add_handler(details_conv_handler)  # New interactive details
+    # Previous/Next buttons on /details pages, which outlive the conversation
+    application.add_handler(CallbackQueryHandler(details_page_selected, pattern=rf"^{DETAILS_PAGE_PREFIX}:"))
 
-    # Register message handler for expense tracking
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_message))
+    # Register message handler for expense tracking. Non-blocking so a slow
+    # Gemini parse doesn't hold up other users' commands and callbacks.
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_message, block=False))
 
     logger.info("Bot is starting... Now open to all users.")
     application.run_polling()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if sys.argv[1:] == ["--profile-startup"]:
+        from startup_profiler import profile_startup
+        profile_startup()
+    elif sys.argv[1:] == ["--check-startup"]:
+        from startup_profiler import check_startup_budget
+        sys.exit(check_startup_budget())
+    else:
+        main()
\ No newline at end of file
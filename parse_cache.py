@@ -0,0 +1,212 @@
+"""Cache of parse results keyed on normalized message text.
+
+Sits in front of Gemini so repeated messages ("lunch 8$" every weekday)
+don't cost an API call. Entries live in a small in-memory LRU backed by the
+parse_cache table, so they survive restarts.
+"""
+import re
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from constants import PARSE_CACHE_MEMORY_SIZE, PARSE_CACHE_MAX_ROWS, PARSE_CACHE_TTL_DAYS
+from db import read_connection, write_connection
+from fast_parser import ISO_DATE_PATTERN, UNRESOLVED_DATE_PATTERN
+
+logger = logging.getLogger(__name__)
+
+# How often (in writes) expired and excess rows are purged from SQLite
+PRUNE_EVERY = 100
+
+# Day numbers like '12/07', '12.07.2025' or 'the 3rd': a date Gemini
+# resolves, even when it happens to resolve to today. Dotted dates need a
+# year so amounts like '3.50' don't count.
+DAY_NUMBER_PATTERN = re.compile(
+    r"\b\d{1,2}/\d{1,2}(?:/\d{2,4})?\b|\b\d{1,2}\.\d{1,2}\.\d{2,4}\b|\b\d{1,2}(?:st|nd|rd|th)\b"
+)
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+_writes_since_prune = 0
+
+
+def normalize_text(message_text):
+    """Lowercases a message and collapses whitespace and trailing punctuation."""
+    text = re.sub(r"\s+", " ", message_text.strip().lower())
+    return text.rstrip(".!?")
+
+
+def _dated_key(text, today):
+    """Key for a result that only holds on the day it was parsed."""
+    return f"{today.isoformat()}|{text}"
+
+
+def _make_key(message_text, today):
+    """
+    Builds the cache key and decides how the result's date is stored.
+
+    Returns:
+        Tuple of (key, relative) where relative means the result's date may
+        be stored as an offset from today and re-dated on every hit (see
+        _implied_offsets for when it actually is).
+    """
+    text = normalize_text(message_text)
+    if ISO_DATE_PATTERN.search(text):
+        # Explicit dates mean the same thing on any day
+        return f"abs|{text}", False
+    if UNRESOLVED_DATE_PATTERN.search(text) or DAY_NUMBER_PATTERN.search(text):
+        # 'last friday' or 'march 3' only mean the same thing on the same day
+        return _dated_key(text, today), False
+    # No date or today/yesterday: same offset from today on every day
+    return f"rel|{text}", True
+
+
+def _implied_offsets(message_text):
+    """
+    Returns the day offsets from today a message without an explicit date
+    can mean: today, and yesterday or the day before when it says so.
+    Results dated anything else (e.g. 'on the 3rd', '12/07', which only
+    Gemini resolved) hold for the day they were parsed only.
+    """
+    text = normalize_text(message_text)
+    offsets = {0}
+    if 'yesterday' in text:
+        offsets.add(-1)
+    if 'day before yesterday' in text:
+        offsets.add(-2)
+    return offsets
+
+
+def _redate(result_json, date_offset, today):
+    """
+    Moves a cached result's dates to the same offset from today.
+
+    date_offset belongs to the first transaction; the others keep their
+    distance from it.
+    """
+    if date_offset is None:
+        return result_json
+    transactions = json.loads(result_json)
+    if isinstance(transactions, dict):
+        # Entries written before results became lists
+        transactions = [transactions]
+    shift = today + timedelta(days=date_offset) - date.fromisoformat(transactions[0]['date'])
+    for transaction in transactions:
+        transaction['date'] = (date.fromisoformat(transaction['date']) + shift).isoformat()
+    return json.dumps(transactions)
+
+
+def _remember(key, entry):
+    """Stores an entry in the in-memory LRU, evicting the oldest if full."""
+    with _lock:
+        _memory[key] = entry
+        _memory.move_to_end(key)
+        while len(_memory) > PARSE_CACHE_MEMORY_SIZE:
+            _memory.popitem(last=False)
+
+
+def get_cached_parse(message_text, today=None):
+    """
+    Looks up a previous parse result for a message.
+
+    Returns:
+        JSON array of transactions, or None on a miss.
+    """
+    today = today or date.today()
+    key, relative = _make_key(message_text, today)
+    now = time.time()
+    if not relative:
+        return _lookup(key, today, now)
+    # Offsets the text can't mean were cached before they were checked
+    result = _lookup(key, today, now, valid_offsets=_implied_offsets(message_text))
+    if result is None:
+        # Relative-looking messages whose result wasn't a plain offset
+        result = _lookup(_dated_key(normalize_text(message_text), today), today, now)
+    return result
+
+
+def _lookup(key, today, now, valid_offsets=None):
+    """Returns the cached result for a key, re-dated for today, or None."""
+    max_age = PARSE_CACHE_TTL_DAYS * 86400
+
+    with _lock:
+        entry = _memory.get(key)
+        if entry is not None:
+            if now - entry[2] <= max_age:
+                _memory.move_to_end(key)
+                return _redate(entry[0], entry[1], today)
+            del _memory[key]
+
+    with read_connection() as conn:
+        row = conn.execute(
+            "SELECT result, date_offset, created_at FROM parse_cache WHERE key = ?", (key,)
+        ).fetchone()
+    if row is None:
+        return None
+    if valid_offsets is not None and row['date_offset'] is not None and row['date_offset'] not in valid_offsets:
+        return None
+    with write_connection() as conn:
+        if now - row['created_at'] > max_age:
+            conn.execute("DELETE FROM parse_cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE parse_cache SET last_used_at = ? WHERE key = ?", (now, key))
+
+    _remember(key, (row['result'], row['date_offset'], row['created_at']))
+    return _redate(row['result'], row['date_offset'], today)
+
+
+def cache_parse(message_text, result_json, today=None):
+    """Stores a successful parse result. Errors and invalid JSON are ignored."""
+    global _writes_since_prune
+    try:
+        data = json.loads(result_json)
+    except (TypeError, ValueError):
+        return
+    if isinstance(data, dict):
+        if "error" in data:
+            return
+        data = [data]
+    if not isinstance(data, list) or not data or not all(isinstance(item, dict) for item in data):
+        return
+
+    today = today or date.today()
+    key, relative = _make_key(message_text, today)
+    date_offset = None
+    if relative:
+        try:
+            offsets = [(date.fromisoformat(transaction['date']) - today).days for transaction in data]
+        except (KeyError, TypeError, ValueError):
+            return
+        if set(offsets) <= _implied_offsets(message_text):
+            date_offset = offsets[0]
+        else:
+            key = _dated_key(normalize_text(message_text), today)
+    now = time.time()
+    result_json = json.dumps(data)
+
+    _remember(key, (result_json, date_offset, now))
+
+    with write_connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO parse_cache (key, result, date_offset, created_at, last_used_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, result_json, date_offset, now, now)
+        )
+        _writes_since_prune += 1
+        if _writes_since_prune >= PRUNE_EVERY:
+            _writes_since_prune = 0
+            _prune(conn, now)
+
+
+def _prune(conn, now):
+    """Deletes expired rows and trims the table to PARSE_CACHE_MAX_ROWS."""
+    conn.execute("DELETE FROM parse_cache WHERE created_at < ?", (now - PARSE_CACHE_TTL_DAYS * 86400,))
+    conn.execute(
+        "DELETE FROM parse_cache WHERE key NOT IN "
+        "(SELECT key FROM parse_cache ORDER BY last_used_at DESC LIMIT ?)",
+        (PARSE_CACHE_MAX_ROWS,)
+    )
+    logger.info("Pruned parse cache")
@@ -0,0 +1,80 @@
+"""Measures how long the bot process takes to import before it can poll.
+
+    python main.py --profile-startup    import-time breakdown, slowest first
+    python main.py --check-startup      exit 1 if a cold import of main.py
+                                        takes longer than STARTUP_BUDGET_SECONDS
+
+Each measurement runs `python -X importtime -c "import main"` in a fresh
+interpreter, so nothing already imported by the caller skews the numbers.
+The check is meant to run in CI so a new top-level import of a heavy library
+gets noticed: it also fails if any of LAZY_MODULES, which the bot only
+loads on first use, is imported at startup.
+"""
+import os
+import re
+import sys
+import time
+import subprocess
+
+from constants import STARTUP_BUDGET_SECONDS
+
+# "import time:   self [us] | cumulative | imported package"
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+# Heavy packages that must not be imported by `import main`
+LAZY_MODULES = ('numpy', 'matplotlib', 'PIL', 'google.genai')
+
+
+def _import_main():
+    """
+    Imports main.py in a fresh interpreter.
+
+    Returns:
+        Tuple of (wall-clock seconds, list of (module, self_us, cumulative_us, depth))
+    """
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing main failed:\n{completed.stderr[-2000:]}")
+
+    modules = []
+    for line in completed.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return elapsed, modules
+
+
+def profile_startup(top=25):
+    """Prints the slowest top-level imports and the overall import time."""
+    elapsed, modules = _import_main()
+    # main and what it imports directly; cumulative time includes everything they pull in
+    roots = sorted((m for m in modules if m[3] <= 1), key=lambda m: m[2], reverse=True)
+    print(f"{'cumulative ms':>14}{'self ms':>10}  module")
+    for name, self_us, cumulative_us, _ in roots[:top]:
+        print(f"{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+    print(f"\nimport main: {elapsed:.2f}s wall clock "
+          f"(budget {STARTUP_BUDGET_SECONDS:.2f}s), {len(modules)} modules")
+
+
+def check_startup_budget():
+    """Returns 0 if main.py imports within STARTUP_BUDGET_SECONDS without LAZY_MODULES, otherwise 1."""
+    elapsed, modules = _import_main()
+    eager = sorted({name for name, _, _, _ in modules if name in LAZY_MODULES})
+    if eager:
+        print(f"Startup imports modules that should load on first use: {', '.join(eager)}")
+        return 1
+    if elapsed > STARTUP_BUDGET_SECONDS:
+        slowest = sorted((m for m in modules if m[3] == 1), key=lambda m: m[2], reverse=True)[:5]
+        print(f"Startup over budget: {elapsed:.2f}s > {STARTUP_BUDGET_SECONDS:.2f}s. Slowest imports: "
+              + ", ".join(f"{name} ({cumulative_us / 1000:.0f} ms)" for name, _, cumulative_us, _ in slowest))
+        return 1
+    print(f"Startup within budget: {elapsed:.2f}s <= {STARTUP_BUDGET_SECONDS:.2f}s")
+    return 0
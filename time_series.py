@@ -0,0 +1,86 @@
+"""Columnar time series of a user's spending, backed by NumPy arrays.
+
+get_time_series() returns one entry for every day, week or month in the
+requested range, with periods without transactions filled with zeros, so
+bars are evenly spaced in time and analytics can work on whole arrays.
+Period starts are generated with datetime64 arithmetic and the totals from
+db.get_period_totals() are scattered into place with one indexed
+assignment, instead of looping over periods in Python.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+from db import parse_date_range, choose_interval, get_period_totals
+
+
+@dataclass
+class TimeSeries:
+    """A user's spending per period over a date range, aligned by index."""
+    interval: str
+    # First day of each period, datetime64[D]
+    dates: np.ndarray
+    # Totals in USD, float64
+    expenses: np.ndarray
+    resisted: np.ndarray
+
+    def to_chart_data(self):
+        """Returns the series in the dictionary form the chart renderers take."""
+        return {
+            'dates': self.dates,
+            'expenses': self.expenses,
+            'resisted': self.resisted,
+            'interval': self.interval,
+        }
+
+
+def period_starts(start_date, end_date, interval):
+    """
+    Returns the first day of every period overlapping a date range.
+
+    Args:
+        start_date, end_date: Inclusive date range
+        interval: 'day', 'week' (starting Mondays), or 'month'
+
+    Returns:
+        datetime64[D] array
+    """
+    start = np.datetime64(start_date, 'D')
+    end = np.datetime64(end_date, 'D')
+    if interval == 'day':
+        return np.arange(start, end + 1)
+    if interval == 'week':
+        # Day 0 (1970-01-01) was a Thursday, as in db.PERIOD_EXPRESSIONS
+        monday = start - (start.astype(np.int64) + 3) % 7
+        return np.arange(monday, end + 1, 7)
+    return np.arange(start.astype('datetime64[M]'), end.astype('datetime64[M]') + 1).astype('datetime64[D]')
+
+
+def get_time_series(user_id, time_range_str, interval='day'):
+    """
+    Gets a user's spending for every period of a time range.
+
+    Args:
+        user_id: Telegram id of the user
+        time_range_str: Time range specification
+        interval: 'day', 'week', or 'month' for grouping; coarsened by
+            db.choose_interval() when the range has too many periods to chart
+
+    Returns:
+        TimeSeries
+    """
+    start_date, end_date = parse_date_range(time_range_str)
+    interval = choose_interval(start_date, end_date, interval)
+    rows = get_period_totals(user_id, start_date, end_date, interval)
+
+    dates = period_starts(start_date, end_date, interval)
+    expenses = np.zeros(len(dates))
+    resisted = np.zeros(len(dates))
+    if rows:
+        totals = np.array([tuple(row) for row in rows], dtype=np.int64)
+        # Day numbers count from 1970-01-01, like datetime64[D]
+        index = np.searchsorted(dates.astype(np.int64), totals[:, 0])
+        expenses[index] = totals[:, 1] / 100
+        resisted[index] = totals[:, 2] / 100
+
+    return TimeSeries(interval=interval, dates=dates, expenses=expenses, resisted=resisted)
@@ -21,4 +21,4 @@ def clean_json_response(response_str):
         cleaned_str = cleaned_str[7:]  # Remove ```json
     if cleaned_str.endswith("```"):
         cleaned_str = cleaned_str[:-3]  # Remove ```
-    return cleaned_str.strip()
\ No newline at end of file
+    return cleaned_str.strip()